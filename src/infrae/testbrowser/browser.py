@@ -2,22 +2,34 @@
 # Copyright (c) 2010-2013 Infrae. All rights reserved.
 # See also LICENSE.txt
 
-import collections
+import copy
 import json
+import sys
+import threading
 import lxml.etree
 import lxml.html
-import re
 import urllib
 import urlparse
 
+from timeit import default_timer
+from infrae.testbrowser.cache import CachedResponse, DocumentCache, HTTPCache
+from infrae.testbrowser.cache import parse_status_code, stored_headers
 from infrae.testbrowser.cookies import Cookies
 from infrae.testbrowser.expressions import Expressions, Link
 from infrae.testbrowser.form import Form
+from infrae.testbrowser.headers import HTTPHeaders
+from infrae.testbrowser.history import History
+from infrae.testbrowser.memory import MemoryTracer
+from infrae.testbrowser.stats import Statistics, is_exported, registry
+from infrae.testbrowser.streaming import iter_json, iter_xml
+from infrae.testbrowser.subresources import PageWeight, SubresourceFetcher
+from infrae.testbrowser.subresources import find_subresources
 from infrae.testbrowser.interfaces import IAdvancedBrowser, _marker
 from infrae.testbrowser.interfaces import ICustomizableOptions
 from infrae.testbrowser.utils import Macros, CustomizableOptions, Handlers
-from infrae.testbrowser.utils import encode_multipart_form_data, format_auth
-from infrae.testbrowser.wsgi import WSGIServer
+from infrae.testbrowser.utils import Timings, canonical_url
+from infrae.testbrowser.utils import encode_form, format_auth
+from infrae.testbrowser.wsgi import WSGIServer, CHARSET_CAPTURE
 
 from zope.interface import implements
 
@@ -30,18 +42,77 @@ class Options(CustomizableOptions):
     follow_redirect = True
     cookie_support = True
     handle_errors = True
+    history_length = HISTORY_LENGTH
+    history_bodies = 0
+    history_max_size = None
+    max_response_size = None
+    spill_threshold = None
 
     # Server options
     server = 'localhost'
     port = '80'
     protocol = 'HTTP/1.0'
     default_wsgi_environ = {}
+    multithread = False
+    multiprocess = False
+    profile = False
+    trace_memory = False
+    http_cache = False
+    http_cache_size = 1000
+    statistics = False
+    statistics_registry = None
+    accept_encoding = False
+    max_redirects = 20
+    cassette = None
+    cassette_mode = 'auto'
+    cassette_match = ('method', 'uri')
+    subresources = False
+    subresources_concurrency = 4
+    incremental_parsing = False
+    document_cache = 0
 
     def __init__(self):
         super(Options, self).__init__(ICustomizableOptions)
 
 
-CHARSET_CAPTURE = re.compile(r'charset=(?P<charset>[^;]+)')
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+
+
+class BatchResult(object):
+    """Response to one of the requests made with ``open_many``.
+    """
+
+    def __init__(self, method, url, status, headers, contents, duration):
+        self.method = method
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.contents = contents
+        self.duration = duration
+
+    @property
+    def status_code(self):
+        try:
+            return int(self.status.split(' ', 1)[0])
+        except ValueError:
+            raise AssertionError(u'Invalid HTTP status %s' % self.status)
+
+    @property
+    def content_type(self):
+        return self.headers.get('content-type')
+
+    @property
+    def json(self):
+        content_type = self.content_type
+        if content_type and content_type.startswith('application/json'):
+            charset = CHARSET_CAPTURE.search(content_type)
+            return json.loads(
+                self.contents,
+                encoding=charset.group('charset') if charset else None)
+        return None
+
+    def __repr__(self):
+        return '<%s %s: %s>' % (self.method, self.url, self.status)
 
 
 class Browser(object):
@@ -52,19 +123,31 @@ class Browser(object):
         self.inspect = Expressions(self)
         self.macros = Macros(self)
         self.handlers = Handlers()
+        self.__app = app
         self.__server = WSGIServer(app, self.options)
         self.__url = None
         self.__method = None
         self.__response = None
         self.__data = None
         self.__data_type = None
+        self.__stream = False
+        self.__redirects = []
+        self.__permanent_redirects = {}
         self.cookies = Cookies()
         self.__request_headers = dict()
-        self.__history = collections.deque([], HISTORY_LENGTH)
+        self.__history = History(self.options)
         self.__cache = {}
-        self.html = None
-        self.xml = None
-        self.json = None
+        self.__parsed = {}
+        self.timings = Timings()
+        self.total_timings = Timings()
+        self.memory = MemoryTracer()
+        self.cache = HTTPCache()
+        self.documents = DocumentCache()
+        self.statistics = Statistics()
+        self.__statistics = None
+        self.__subresources = SubresourceFetcher(
+            self.__query_subresource, self.__resolve_subresource)
+        self.__page_weight = None
 
     def __enter__(self):
         return self
@@ -111,13 +194,135 @@ class Browser(object):
     @property
     def contents(self):
         if self.__response is not None:
-            contents = self.__response.output.getvalue()
+            contents = self.__response.getvalue()
             if self.content_encoding is not None:
                 return contents.decode(self.content_encoding)
             else:
                 return contents
         return None
 
+    def __parse(self, name, content_types, parser, cached=False):
+        # Parse the response payload the first time it is accessed,
+        # and remember the result until the next request. Only lxml
+        # documents are kept in the document cache, as they are
+        # cheaper to copy than to parse again.
+        if name not in self.__parsed:
+            value = None
+            content_type = self.content_type
+            if (content_type and content_type.startswith(content_types) and
+                self.__response.getfile().size):
+                start = default_timer()
+                key = None
+                if cached and self.options.document_cache:
+                    # Relative URLs are resolved from the location.
+                    key = self.documents.key(
+                        name, content_type,
+                        '/'.join(self.location.split('/')[:-1]),
+                        self.__response.getfile())
+                    value = self.documents.get(key)
+                    if value is not None and self.__statistics is not None:
+                        self.__statistics.increment(
+                            'cache_hits', cache='document')
+                if value is None:
+                    value = parser(self.__response.getfile())
+                    if key is not None and value is not None:
+                        value = self.documents.store(
+                            key, value, self.options.document_cache)
+                duration = default_timer() - start
+                self.__add_timing('parse', duration)
+                if self.__statistics is not None:
+                    self.__statistics.observe(
+                        'parse_seconds', duration, format=name)
+            self.__parsed[name] = value
+        return self.__parsed[name]
+
+    def __add_timing(self, phase, duration):
+        self.timings.add(phase, duration)
+        self.total_timings.add(phase, duration)
+
+    @property
+    def html(self):
+
+        def parser(output):
+            if self.__response.document is not None:
+                # Parsed while the payload was received.
+                html = self.__response.document
+            elif output.spilled:
+                # Parse big payloads directly from their file.
+                html = lxml.html.parse(
+                    output,
+                    lxml.html.HTMLParser(encoding=self.content_encoding))
+                html = html.getroot()
+            else:
+                html = lxml.html.document_fromstring(self.contents)
+            html.resolve_base_href()
+            return html
+
+        return self.__parse(
+            'html', ('text/html', 'text/xhtml'), parser, cached=True)
+
+    @property
+    def xml(self):
+
+        def parser(output):
+            if output.spilled:
+                return lxml.etree.parse(output).getroot()
+            return lxml.etree.fromstring(output.getvalue())
+
+        return self.__parse('xml', ('text/xml',), parser, cached=True)
+
+    def iter_xml(self, tag=None, path=None):
+        content_type = self.content_type
+        assert content_type and content_type.startswith('text/xml'), \
+            u'Not viewing XML'
+        if self.__response.stream is not None:
+            return iter_xml(self.__response.stream, tag, path)
+        return iter_xml(self.__response.getfile(), tag, path)
+
+    @property
+    def json(self):
+
+        def parser(output):
+            # Decode the payload directly, without an unicode copy.
+            if output.spilled:
+                return json.load(output, encoding=self.content_encoding)
+            return json.loads(
+                output.getvalue(), encoding=self.content_encoding)
+
+        return self.__parse('json', ('application/json',), parser)
+
+    def iter_json(self, path=None):
+        content_type = self.content_type
+        assert content_type and content_type.startswith('application/json'), \
+            u'Not viewing JSON'
+        if self.__response.stream is not None:
+            source = self.__response.stream
+        else:
+            source = self.__response.getfile()
+        return iter_json(source, path, self.content_encoding)
+
+    @property
+    def profiles(self):
+        return self.__server.profiles
+
+    @property
+    def wire_size(self):
+        if self.__response is not None:
+            return self.__response.wire_size
+        return None
+
+    @property
+    def decoded_size(self):
+        if self.__response is not None:
+            return self.__response.size
+        return None
+
+    @property
+    def stream(self):
+        if self.__response is not None:
+            return self.__response.stream
+        return None
+
     @property
     def content_type(self):
         return self.headers.get('content-type')
@@ -166,10 +371,24 @@ class Browser(object):
 
     @property
     def history(self):
-        return map(lambda e: e[0], self.__history)
+        return self.__history.urls()
 
-    def _query_application(self, url, method, query, data, data_type):
-        self.__cache = {}
+    @property
+    def history_entries(self):
+        return self.__history
+
+    @property
+    def redirects(self):
+        return list(self.__redirects)
+
+    @property
+    def page_weight(self):
+        return self.__page_weight
+
+    def __get_uri(self, url, query):
+        """Return the URI to query on the server, and the
+        authorization included in the URL if any.
+        """
         info = urlparse.urlparse(url)
         query_string = urllib.urlencode(query) if query else ''
         uri = urlparse.urlunparse(
@@ -179,119 +398,361 @@ class Browser(object):
              info.params,
              query_string or info.query,
              info.fragment))
-        self.__url = uri
+        authorization = None
+        if info.username and info.password:
+            authorization = format_auth(info.username, info.password)
+        return uri, authorization
+
+    def _query_application(self, url, method, query, data, data_type):
+        uri, authorization = self.__get_uri(url, query)
+        self.__redirects = []
+        visited = set()
+        # Only the time spent to follow the redirects, not the one of
+        # the redirected requests which have their own phases.
+        duration = 0.0
+        while True:
+            if len(self.__redirects) > self.options.max_redirects:
+                raise AssertionError(
+                    u'More than %d redirects' % self.options.max_redirects)
+            key = (self.options.server, self.options.port, uri)
+            # A page can be visited again once a cookie changed, like
+            # when a login form redirects back to the protected page.
+            visit = (method,) + key + (
+                self.cookies.get_request_headers().get('Cookie'),)
+            if visit in visited:
+                raise AssertionError(u'Redirect loop on %s' % uri)
+            visited.add(visit)
+            self.__url = uri
+            self.__method = method
+            start = default_timer()
+            memo = None
+            if self.options.follow_redirect and method in ('GET', 'HEAD'):
+                memo = self.__permanent_redirects.get(key)
+            if memo is not None:
+                # Replay the permanent redirect without the application.
+                response = CachedResponse(memo[0], memo[1], '')
+            else:
+                response = self.__query_uri(
+                    method, uri, data, data_type, authorization)
+            if 'response' in self.handlers:
+                self.handlers.response(self, method, uri, response)
+            self._process_response(response)
+            if memo is None:
+                start = default_timer()
+            target = self.__get_redirect_target(response)
+            if target is None:
+                break
+            if ('redirect' in self.handlers and
+                self.handlers.redirect(self, response, target) is False):
+                break
+            status_code = self.status_code
+            if (memo is None and status_code in (301, 308) and
+                method in ('GET', 'HEAD')):
+                headers = HTTPHeaders()
+                headers.update(stored_headers(response.headers))
+                self.__permanent_redirects[key] = (response.status, headers)
+            if status_code in (301, 302, 303):
+                if method not in ('GET', 'HEAD'):
+                    method = 'GET'
+                data = data_type = None
+            response.close()
+            self.__redirects.append(uri)
+            self.options.server, self.options.port, uri = target
+            authorization = None
+            duration += default_timer() - start
+        if self.__redirects:
+            self.__add_timing('redirect', duration)
+            if self.__statistics is not None:
+                self.__statistics.increment(
+                    'redirects', len(self.__redirects))
+
+    def __attach_statistics(self):
+        aggregate = self.options.statistics_registry
+        if aggregate is None:
+            aggregate = is_exported()
+        self.statistics.parent = registry if aggregate else None
+        if aggregate or self.options.statistics:
+            self.__statistics = self.statistics
+        else:
+            self.__statistics = None
+
+    def __record(self, method, response, data):
+        statistics = self.__statistics
+        if statistics is None:
+            return
+        status_code = parse_status_code(response.status)
+        statistics.increment(
+            'requests', method=method,
+            status=status_code if status_code is not None else 'error')
+        statistics.increment('received_bytes', response.wire_size)
+        if data:
+            statistics.increment('sent_bytes', len(data))
+
+    def __get_request_headers(self):
         headers = self.__request_headers.copy()
         headers.update(self.cookies.get_request_headers())
-        if info.username and info.password:
-            headers['Authorization'] = format_auth(
-                info.username, info.password)
-        self._process_response(
-            self.__server(method, uri, headers.items(), data, data_type))
+        if self.options.accept_encoding and not filter(
+            lambda key: key.lower() == 'accept-encoding', headers.keys()):
+            headers['Accept-Encoding'] = 'gzip, deflate'
+        return headers
+
+    def __query_uri(self, method, uri, data, data_type, authorization):
+        self.__cache = {}
+        self.__parsed = {}
+        headers = self.__get_request_headers()
+        if authorization is not None:
+            headers['Authorization'] = authorization
+        return self.__request(method, uri, headers, data, data_type, True)
+
+    def __request(self, method, uri, headers, data=None, data_type=None,
+                  page=False, multithread=False):
+        # Used for the pages, their subresources and the batches. The
+        # HTTP cache, the memory tracer and the timings are only used
+        # for the page.
+        if 'request' in self.handlers:
+            # Handlers can change the headers, or answer themselves.
+            response = self.handlers.request(self, method, uri, headers)
+            if response is not None:
+                self.__record(method, response, data)
+                return response
+
+        def query_server(headers):
+            return self.__query_server(
+                method, uri, headers, data, data_type, page, multithread)
+
+        if (page and self.options.http_cache and method == 'GET' and
+            not self.__stream):
+            queried = []
+
+            def query_cache(headers):
+                response = query_server(headers)
+                queried.append(response)
+                return response
+
+            hits = self.cache.hits
+            response = self.cache(
+                '//%s:%s%s' % (self.options.server, self.options.port, uri),
+                headers, query_cache, self.options.http_cache_size)
+            if self.cache.hits != hits and self.__statistics is not None:
+                self.__statistics.increment('cache_hits', cache='http')
+            # Count the response of the application, like a 304 when
+            # the cached one is revalidated.
+            self.__record(method, queried[0] if queried else response, data)
+            return response
+        response = query_server(headers)
+        self.__record(method, response, data)
+        return response
+
+    def __query_server(self, method, uri, headers, data, data_type,
+                       page, multithread):
+        trace_memory = page and self.options.trace_memory
+        if trace_memory:
+            before = self.memory.snapshot()
+        start = default_timer()
+        response = self.__server(
+            method, uri, headers.items(), data, data_type,
+            page and self.__stream, multithread)
+        if trace_memory:
+            self.memory.record(uri, 'application', before)
+        duration = default_timer() - start
+        if self.__statistics is not None:
+            self.__statistics.observe(
+                'request_seconds', duration, method=method)
+        if 'query' in self.handlers:
+            self.handlers.query(self, method, uri, response, duration)
+        if page:
+            self.timings.merge(response.timings)
+            self.total_timings.merge(response.timings)
+        return response
+
+    def __query_subresource(self, uri):
+        # Called from the fetcher threads.
+        response = self.__request(
+            'GET', uri, self.__get_request_headers(),
+            multithread=self.options.subresources_concurrency > 1)
+        if self.options.cookie_support:
+            cookie = response.headers.get('Set-Cookie')
+            if cookie:
+                self.cookies.parse(cookie)
+        return response
+
+    def __resolve_subresource(self, url, base):
+        return canonical_url(urlparse.urljoin(base, url), self.options)
+
+    def __load_subresources(self):
+        start = default_timer()
+        resources = []
+        if self.html is not None:
+            resources = self.__subresources.fetch(
+                map(lambda (type, url): (
+                        type, self.__resolve_subresource(url, self.__url)),
+                    find_subresources(self.html)),
+                self.options.subresources_concurrency)
+        self.__add_timing('subresources', default_timer() - start)
+        self.__page_weight = PageWeight(
+            self.decoded_size, resources, sum(self.timings.values()))
+
+    def __release_response(self):
+        # The payload of the current page stays readable until another
+        # one is opened, even once the browser is closed.
+        if self.__response is not None:
+            self.__response.close()
+            self.__response.output.close()
 
     def _process_response(self, response):
         self.__response = response
 
         # Cookie support
         if self.options.cookie_support:
+            start = default_timer()
             cookie = self.headers.get('Set-Cookie')
             if cookie:
                 self.cookies.parse(cookie)
-
-        # Redirect
-        if (self.status_code in (301, 302, 303) and
-            self.options.follow_redirect):
-            if self.__method not in ('GET', 'HEAD'):
-                self.__method = 'GET'
-            location = self.headers.get('Location')
-            assert location is not None, 'Redirect without location header'
-            location_url = urlparse.urlparse(location)
-            location_uri = None
-            if location_url.netloc:
-                # Inspect redirect URL
-                if ':' in location_url.netloc:
-                    server, port = location_url.netloc.split(':', 1)
-                else:
-                    server = location_url.netloc
-                    if location_url.scheme == 'https':
-                        port = '443'
-                    else:
-                        port = '80'
-                if server != self.options.server or port != self.options.port:
-                    if self.options.follow_external_redirect:
-                        # XXX Should include this information in history as well
-                        self.options.server = server
-                        self.options.port = port
-                        location_uri = urlparse.urlunparse(
-                            (None, None) + location_url[2:])
-                else:
-                    location_uri = urlparse.urlunparse(
-                        (None, None) + location_url[2:])
+            self.__add_timing('cookies', default_timer() - start)
+
+    def __get_redirect_target(self, response):
+        """Return the server, port and URI to which the response
+        redirects, or None if it must not be followed.
+        """
+        if (self.status_code not in REDIRECT_STATUS or
+            not self.options.follow_redirect):
+            return None
+        location = self.headers.get('Location')
+        assert location is not None, 'Redirect without location header'
+        location_url = urlparse.urlparse(location)
+        if not location_url.netloc:
+            return (self.options.server, self.options.port, location)
+        # Inspect redirect URL
+        if ':' in location_url.netloc:
+            server, port = location_url.netloc.split(':', 1)
+        else:
+            server = location_url.netloc
+            if location_url.scheme == 'https':
+                port = '443'
             else:
-                location_uri = location
-            if location_uri is not None:
-                return self._query_application(
-                    location_uri, self.__method, None, None, None)
-
-        # Parse HTML or XML
-        if response is not None:
-            content_type = response.headers.get('content-type')
-            data = response.output.getvalue()
-            if content_type and data:
-                if (content_type.startswith('text/html') or
-                    content_type.startswith('text/xhtml')):
-                    self.html = lxml.html.document_fromstring(self.contents)
-                    self.html.resolve_base_href()
-                elif content_type.startswith('text/xml'):
-                    self.xml = lxml.etree.fromstring(data)
-                elif content_type.startswith('application/json'):
-                    self.json = json.loads(self.contents)
+                port = '80'
+        if ((server != self.options.server or port != self.options.port) and
+            not self.options.follow_external_redirect):
+            return None
+        # XXX Should include external redirects in history as well
+        return (server, port,
+                urlparse.urlunparse((None, None) + location_url[2:]))
 
     def open(self, url, method='GET', query=None,
              form=None, form_charset='utf-8', form_enctype='application/x-www-form-urlencoded',
-             data=None, data_type=None):
+             data=None, data_type=None, stream=False):
+        if self.options.trace_memory:
+            self.memory.checkpoint(self.__url)
         if self.__response:
             self.__history.append(
-                (self.__url, self.__method, self.__response))
-        self.html = None
-        self.xml = None
-        self.json = None
+                self.__url, self.__method, self.__response)
+            self.__release_response()
+        self.__parsed = {}
         self.__response = None
         self.__method = method
+        self.__attach_statistics()
         
         if form is not None:
-            assert not data, u'cannot have both form and data'
-            assert not data_type, u'cannot specify data_type when using form'
             # We posted a form
-            if method == 'GET':
-                assert form_enctype == 'application/x-www-form-urlencoded', \
-                    u'Invalid form encoding for GET method'
-                if query is not None:
-                    raise AssertionError(
-                        u'Cannot handle a query with a GET form')
-                query = form
-            else:
-                assert method == 'POST', u'Only support POST or GET forms'
-                if form_enctype == 'application/x-www-form-urlencoded':
-                    data_type = 'application/x-www-form-urlencoded'
-                    data = urllib.urlencode(form)
-                elif form_enctype == 'multipart/form-data':
-                    data_type, data = encode_multipart_form_data(form, form_charset)
-                else:
-                    raise AssertionError(
-                        u"Unsupported form encoding %s" % form_enctype)
+            if self.__statistics is not None:
+                self.__statistics.increment('form_submissions', method=method)
+            query, data, data_type = encode_form(
+                method, query, form, form_charset, form_enctype,
+                data, data_type)
         self.__data = data
         self.__data_type = data_type
+        self.__stream = stream
+        self.__page_weight = None
+        self.timings = Timings()
         self._query_application(url, method, query, data, data_type)
+        if self.options.subresources and not stream:
+            self.__load_subresources()
         return self.status_code
 
+    def __open_batched(self, request, multithread=False):
+        if isinstance(request, basestring):
+            request = {'url': request}
+        method = request.get('method', 'GET')
+        query = request.get('query')
+        data = request.get('data')
+        data_type = request.get('data_type')
+        if request.get('form') is not None:
+            query, data, data_type = encode_form(
+                method, query, request['form'],
+                request.get('form_charset', 'utf-8'),
+                request.get('form_enctype',
+                            'application/x-www-form-urlencoded'),
+                data, data_type)
+        uri, authorization = self.__get_uri(request['url'], query)
+        headers = self.__get_request_headers()
+        if authorization is not None:
+            headers['Authorization'] = authorization
+        start = default_timer()
+        response = self.__request(
+            method, uri, headers, data, data_type, multithread=multithread)
+        duration = default_timer() - start
+        try:
+            contents = response.getvalue()
+        finally:
+            response.close()
+        return BatchResult(
+            method, uri, response.status, response.headers, contents,
+            duration)
+
+    def open_many(self, requests, concurrency=1):
+        """Make each of the requests, without changing the current
+        page, and return the responses in the same order.
+        """
+        self.__attach_statistics()
+        if concurrency <= 1:
+            return map(self.__open_batched, requests)
+        lock = threading.Lock()
+        work = enumerate(requests)
+        results = {}
+        errors = []
+
+        def worker():
+            while True:
+                with lock:
+                    if errors:
+                        return
+                    index, request = next(work, (None, None))
+                if index is None:
+                    return
+                try:
+                    result = self.__open_batched(request, True)
+                except Exception:
+                    with lock:
+                        errors.append(sys.exc_info())
+                    return
+                with lock:
+                    results[index] = result
+
+        threads = []
+        for count in range(concurrency):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+        return map(lambda index: results[index], sorted(results.keys()))
+
     def reload(self):
         assert self.__url is not None, 'No URL to reload'
-        self.html = None
-        self.xml = None
-        self.json = None
+        if self.options.trace_memory:
+            self.memory.checkpoint(self.__url)
+        self.__release_response()
+        self.__parsed = {}
+        self.timings = Timings()
         self.__response = None
+        self.__page_weight = None
         self._query_application(
             self.__url, self.__method, None, self.__data, self.__data_type)
+        if self.options.subresources and not self.__stream:
+            self.__load_subresources()
         return self.status_code
 
     def get_form(self, name=None, id=None):
@@ -317,6 +778,43 @@ class Browser(object):
         assert len(urls) == 1, u'No link found'
         return Link(urls.values()[0], self)
 
+    def fork(self):
+        """Return a new browser on the same application, that
+        continues from the current state of this one.
+        """
+        browser = Browser(self.__app)
+        options = self.options.__dict__.copy()
+        if 'default_wsgi_environ' in options:
+            options['default_wsgi_environ'] = options[
+                'default_wsgi_environ'].copy()
+        browser.options.__dict__.update(options)
+        browser.inspect = self.inspect.copy(browser)
+        browser.macros = self.macros.copy(browser)
+        browser.handlers = self.handlers.copy()
+        browser.cookies = self.cookies.copy()
+        browser.__request_headers = self.__request_headers.copy()
+        browser.__history = self.__history.copy(browser.options)
+        browser.__permanent_redirects = self.__permanent_redirects.copy()
+        browser.__url = self.__url
+        browser.__method = self.__method
+        browser.__data = self.__data
+        browser.__data_type = self.__data_type
+        browser.__redirects = list(self.__redirects)
+        if self.__response is not None:
+            # The payload is shared, a streamed one is read first.
+            browser.__response = CachedResponse(
+                self.__response.status,
+                self.__response.headers,
+                self.__response.getvalue())
+            # Parsed documents can be modified, they are copied.
+            browser.__parsed = copy.deepcopy(self.__parsed)
+        return browser
+
     def close(self):
+        if self.options.trace_memory:
+            self.memory.checkpoint(self.__url)
+        if self.__response is not None:
+            self.__response.close()
+        self.__server.close()
         if 'close' in self.handlers:
             self.handlers.close(self)
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import collections
+import copy
+import email.utils
+import hashlib
+import time
+
+from infrae.testbrowser.headers import HTTPHeaders
+from infrae.testbrowser.interfaces import IDocumentCache, IHTTPCache
+from infrae.testbrowser.interfaces import IWSGIResponse
+from infrae.testbrowser.utils import Timings
+from infrae.testbrowser.wsgi import WSGIOutput
+
+from zope.interface import implements
+
+CACHEABLE_STATUS = (200, 203, 300, 301, 410)
+
+
+def stored_headers(headers):
+    """Return the headers of a response that can be stored: cookies
+    are set by the response that sent them only.
+    """
+    return filter(lambda (name, value): name.lower() != 'set-cookie',
+                  headers.items())
+
+
+def parse_status_code(status):
+    try:
+        return int(status.split(' ', 1)[0])
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_date(value):
+    if value:
+        date = email.utils.parsedate_tz(value)
+        if date is not None:
+            return email.utils.mktime_tz(date)
+    return None
+
+
+def parse_cache_control(value):
+    directives = {}
+    for directive in (value or '').split(','):
+        directive = directive.strip().lower()
+        if not directive:
+            continue
+        if '=' in directive:
+            name, argument = directive.split('=', 1)
+            directives[name.strip()] = argument.strip().strip('"')
+        else:
+            directives[directive] = None
+    return directives
+
+
+class CachedResponse(object):
+    """A response served from the cache.
+    """
+    implements(IWSGIResponse)
+
+    def __init__(self, status, headers, data):
+        self.status = status
+        self.headers = HTTPHeaders()
+        self.headers.update(headers.items())
+        self.output = WSGIOutput()
+        self.output.write(data)
+        self.output.seek(0)
+        self.stream = None
+        self.document = None
+        self.timings = Timings()
+        self.wire_size = 0
+        self.size = len(data)
+
+    def getfile(self):
+        self.output.seek(0)
+        return self.output
+
+    def getvalue(self):
+        return self.output.getvalue()
+
+    def close(self):
+        pass
+
+
+class CacheEntry(object):
+    """A response stored in the cache.
+    """
+
+    def __init__(self, response, vary, stored):
+        self.status = response.status
+        self.headers = HTTPHeaders()
+        self.headers.update(stored_headers(response.headers))
+        self.data = response.getvalue()
+        self.vary = vary
+        self.stored = stored
+
+    def update(self, response, stored):
+        # Headers of a 304 response replace the stored ones.
+        self.headers.update(stored_headers(response.headers))
+        self.stored = stored
+
+    @property
+    def lifetime(self):
+        """Number of seconds the entry is fresh.
+        """
+        directives = parse_cache_control(self.headers.get('Cache-Control'))
+        if 'no-cache' in directives:
+            return 0
+        if 'max-age' in directives:
+            try:
+                return int(directives['max-age'])
+            except ValueError:
+                return 0
+        expires = parse_date(self.headers.get('Expires'))
+        if expires is not None:
+            date = parse_date(self.headers.get('Date')) or self.stored
+            return expires - date
+        return 0
+
+    def age(self, now):
+        try:
+            age = int(self.headers.get('Age', 0))
+        except ValueError:
+            age = 0
+        return max(now - self.stored, 0) + age
+
+    def is_fresh(self, now):
+        return self.age(now) < self.lifetime
+
+    @property
+    def validators(self):
+        """Headers to use to revalidate the entry.
+        """
+        headers = {}
+        if 'ETag' in self.headers:
+            headers['If-None-Match'] = self.headers['ETag']
+        if 'Last-Modified' in self.headers:
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+        return headers
+
+    def response(self):
+        return CachedResponse(self.status, self.headers, self.data)
+
+
+class HTTPCache(object):
+    """Private HTTP cache, storing responses by URL and by the
+    request headers listed in their Vary header. The least recently
+    used URLs are discarded first.
+    """
+    implements(IHTTPCache)
+
+    def __init__(self, clock=time.time):
+        self.__clock = clock
+        self.__entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def __vary(self, names, request_headers):
+        headers = HTTPHeaders()
+        headers.update(request_headers.items())
+        return tuple(map(lambda name: headers.get(name), names))
+
+    def lookup(self, uri, request_headers):
+        """Return the entry matching the request, or None.
+        """
+        entries = self.__entries.pop(uri, None)
+        if entries is None:
+            return None
+        # Mark it as the most recently used.
+        self.__entries[uri] = entries
+        for entry in entries:
+            names, values = entry.vary
+            if self.__vary(names, request_headers) == values:
+                return entry
+        return None
+
+    def store(self, uri, request_headers, response, size=None):
+        """Store the response if it is cacheable, keeping at most
+        ``size`` responses.
+        """
+        if response.stream is not None:
+            return None
+        if parse_status_code(response.status) not in CACHEABLE_STATUS:
+            return None
+        directives = parse_cache_control(response.headers.get('Cache-Control'))
+        if 'no-store' in directives:
+            return None
+        names = tuple(filter(None, map(
+                    lambda name: name.strip().lower(),
+                    response.headers.get('Vary', '').split(','))))
+        if '*' in names:
+            return None
+        entry = CacheEntry(
+            response,
+            (names, self.__vary(names, request_headers)),
+            self.__clock())
+        if not (entry.lifetime or entry.validators):
+            return None
+        entries = filter(
+            lambda e: e.vary != entry.vary, self.__entries.pop(uri, []))
+        entries.append(entry)
+        self.__entries[uri] = entries
+        while (size is not None and len(self.__entries) > 1 and
+               len(self) > size):
+            self.__entries.popitem(last=False)
+        return entry
+
+    def __call__(self, uri, headers, query, size=None):
+        """Answer a GET request to ``uri`` (that includes the
+        server) with ``headers``, using ``query(headers)`` to ask the
+        application when needed. At most ``size`` responses are kept.
+        """
+        entry = self.lookup(uri, headers)
+        if entry is not None:
+            if entry.is_fresh(self.__clock()):
+                self.hits += 1
+                return entry.response()
+            conditional = headers.copy()
+            conditional.update(entry.validators)
+            response = query(conditional)
+            if parse_status_code(response.status) == 304:
+                self.revalidations += 1
+                entry.update(response, self.__clock())
+                cached = entry.response()
+                cached.timings.merge(response.timings)
+                if 'Set-Cookie' in response.headers:
+                    cached.headers['Set-Cookie'] = response.headers[
+                        'Set-Cookie']
+                response.close()
+                return cached
+        else:
+            response = query(headers)
+        self.misses += 1
+        self.store(uri, headers, response, size)
+        return response
+
+    def __len__(self):
+        return sum(map(len, self.__entries.values()))
+
+    def clear(self):
+        self.__entries.clear()
+
+
+class DocumentCache(object):
+    """Parsed lxml documents, stored by a hash of their payload. A
+    copy is returned when they are stored and when they are
+    retrieved, so changes made to them are not shared.
+    """
+    implements(IDocumentCache)
+
+    def __init__(self):
+        self.__documents = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, kind, content_type, base, output):
+        """Return the key of the document of the given ``kind``
+        parsed from ``output``.
+        """
+        digest = hashlib.sha1()
+        digest.update('\0'.join((kind, content_type or '', base or '', '')))
+        output.seek(0)
+        while True:
+            data = output.read(65536)
+            if not data:
+                break
+            digest.update(data)
+        output.seek(0)
+        return digest.hexdigest()
+
+    def get(self, key):
+        document = self.__documents.pop(key, None)
+        if document is None:
+            self.misses += 1
+            return None
+        # Mark it as the most recently used.
+        self.__documents[key] = document
+        self.hits += 1
+        return copy.deepcopy(document)
+
+    def store(self, key, document, size):
+        """Store a document, keeping only the ``size`` most recently
+        used ones, and return a copy of it to use instead.
+        """
+        self.__documents[key] = document
+        while len(self.__documents) > size:
+            self.__documents.popitem(last=False)
+        return copy.deepcopy(document)
+
+    def __len__(self):
+        return len(self.__documents)
+
+    def clear(self):
+        self.__documents.clear()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import atexit
+import base64
+import collections
+import gzip
+import json
+import os
+import threading
+import weakref
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from infrae.testbrowser.interfaces import ICassette
+
+from zope.interface import implements
+
+CASSETTE_MODES = ('auto', 'record', 'replay')
+CASSETTE_MATCH = ('method', 'uri', 'headers', 'body')
+
+# Cassettes with interactions to save, and files already started
+# again by a cassette in record mode in this process.
+_cassettes = weakref.WeakSet()
+_recorded = set()
+
+
+def _save_all():
+    for cassette in list(_cassettes):
+        cassette.save()
+
+atexit.register(_save_all)
+
+
+def encode_body(data):
+    if data is None:
+        return None
+    return base64.b64encode(data)
+
+
+def decode_body(data):
+    if data is None:
+        return None
+    return base64.b64decode(data)
+
+
+class Cassette(object):
+    """Interactions with an application, recorded in a gzipped file
+    with one JSON interaction per line. Requests are matched on the
+    fields listed in ``match``. If a request was recorded more than
+    once, the responses are replayed in the order they were recorded.
+
+    New interactions are kept in memory, and appended to the file by
+    ``save``, when the browser is closed or at exit. Appending is
+    locked, so cassettes of several threads or processes can share
+    the same file. In ``record`` mode, the file is started again only
+    by the first cassette of the process using it.
+    """
+    implements(ICassette)
+
+    def __init__(self, path, mode='auto', match=('method', 'uri')):
+        if mode not in CASSETTE_MODES:
+            raise AssertionError(u'Unknown cassette mode %s' % mode)
+        for field in match:
+            if field not in CASSETTE_MATCH:
+                raise AssertionError(u'Unknown cassette match %s' % field)
+        self.path = path
+        self.mode = mode
+        self.match = tuple(match)
+        self.__lock = threading.Lock()
+        self.__interactions = []
+        self.__pending = []
+        self.__responses = collections.defaultdict(list)
+        self.__played = collections.defaultdict(int)
+        if mode == 'record':
+            if os.path.abspath(path) not in _recorded:
+                _recorded.add(os.path.abspath(path))
+                open(path, 'wb').close()
+        elif os.path.exists(path):
+            with gzip.open(path, 'rb') as cassette:
+                for line in cassette:
+                    if line.strip():
+                        request, response = json.loads(line)
+                        self.__add(request, response)
+
+    def __add(self, request, response):
+        self.__interactions.append((request, response))
+        key = self.key(
+            request['method'], request['uri'], request['headers'],
+            decode_body(request['body']))
+        self.__responses[key].append(response)
+
+    def key(self, method, uri, headers, data):
+        """Return the key used to match a request.
+        """
+        fields = {'method': method,
+                  'uri': uri,
+                  'headers': tuple(sorted(
+                    map(lambda (name, value): (name.lower(), value),
+                        headers))),
+                  'body': data}
+        return tuple(map(lambda field: fields[field], self.match))
+
+    def play(self, method, uri, headers, data=None):
+        """Return a WSGI application replaying the recorded response
+        to the request, or None if there is none.
+        """
+        if self.mode == 'record':
+            return None
+        key = self.key(method, uri, headers, data)
+        with self.__lock:
+            responses = self.__responses.get(key)
+            if not responses:
+                if self.mode == 'replay':
+                    raise AssertionError(
+                        u'No recorded response for %s %s' % (method, uri))
+                return None
+            index = min(self.__played[key], len(responses) - 1)
+            self.__played[key] += 1
+            response = responses[index]
+
+        def replay(environ, start_response):
+            start_response(
+                str(response['status']),
+                map(lambda (name, value): (str(name), str(value)),
+                    response['headers']))
+            return [decode_body(response['body'])]
+
+        return replay
+
+    def record(self, method, uri, headers, data, app):
+        """Return a WSGI application calling ``app`` and recording
+        its response to the request, once it is entirely consumed.
+        """
+
+        def recorder(environ, start_response):
+            response = {}
+            chunks = []
+
+            def record_start_response(status, response_headers,
+                                      exc_info=None):
+                response['status'] = status
+                response['headers'] = list(response_headers)
+                write = start_response(status, response_headers, exc_info)
+
+                def record_write(chunk):
+                    chunks.append(chunk)
+                    write(chunk)
+
+                return record_write
+
+            result = app(environ, record_start_response)
+            try:
+                for chunk in result:
+                    chunks.append(chunk)
+                    yield chunk
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            response['body'] = encode_body(''.join(chunks))
+            request = {'method': method,
+                       'uri': uri,
+                       'headers': list(headers),
+                       'body': encode_body(data)}
+            with self.__lock:
+                self.__add(request, response)
+                self.__pending.append((request, response))
+                _cassettes.add(self)
+
+        return recorder
+
+    def save(self):
+        """Append the interactions recorded since the last call to
+        the file.
+        """
+        with self.__lock:
+            pending = self.__pending
+            self.__pending = []
+            if not pending:
+                return
+            with open(self.path, 'ab') as output:
+                if fcntl is not None:
+                    # Other processes might write the same cassette.
+                    fcntl.flock(output, fcntl.LOCK_EX)
+                try:
+                    # Each save adds a gzip member, they are read as
+                    # one stream.
+                    cassette = gzip.GzipFile(fileobj=output, mode='wb')
+                    for interaction in pending:
+                        cassette.write(json.dumps(interaction) + '\n')
+                    cassette.close()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(output, fcntl.LOCK_UN)
+
+    def __len__(self):
+        return len(self.__interactions)
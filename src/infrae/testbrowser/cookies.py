@@ -87,6 +87,14 @@ class Cookies(object):
     def clear(self):
         self.cookies = {}
 
+    def copy(self):
+        cookies = Cookies()
+        for name, cookie in self.cookies.items():
+            copied = Cookie(cookie.name, cookie.value)
+            copied.options = cookie.options.copy()
+            cookies.cookies[name] = copied
+        return cookies
+
     def keys(self):
         return self.cookies.keys()
 
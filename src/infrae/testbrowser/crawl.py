@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import Queue
+import operator
+import threading
+import traceback
+import urllib
+import urlparse
+
+from timeit import default_timer
+
+from infrae.testbrowser.browser import Browser
+from infrae.testbrowser.cookies import Cookies
+from infrae.testbrowser.form import Form
+from infrae.testbrowser.utils import canonical_url, resolve_url
+
+
+class CrawledPage(object):
+    """Outcome of the visit of one page.
+    """
+
+    def __init__(self, url, depth, referrer=None, status_code=None,
+                 size=None, duration=0.0, error=None):
+        self.url = url
+        self.depth = depth
+        self.referrer = referrer
+        self.status_code = status_code
+        self.size = size
+        self.duration = duration
+        self.error = error
+
+    @property
+    def failed(self):
+        return self.error is not None or self.status_code >= 400
+
+    def __repr__(self):
+        if self.error is not None:
+            return '<failed %s>' % self.url
+        return '<%s %s>' % (self.status_code, self.url)
+
+
+class CrawlReport(object):
+    """Visited pages, in the order they were discovered.
+    """
+
+    def __init__(self, pages, duration):
+        self.pages = pages
+        self.duration = duration
+
+    @property
+    def urls(self):
+        return map(lambda p: p.url, self.pages)
+
+    @property
+    def errors(self):
+        return filter(lambda p: p.failed, self.pages)
+
+    def slowest(self, count=10):
+        return sorted(
+            self.pages, key=operator.attrgetter('duration'),
+            reverse=True)[:count]
+
+    def check(self):
+        """Raise an AssertionError if any of the pages failed.
+        """
+        errors = self.errors
+        if errors:
+            raise AssertionError(
+                u'%d page(s) out of %d failed: %s' % (
+                    len(errors), len(self.pages),
+                    ', '.join(map(repr, errors))))
+
+    def format(self):
+        lines = []
+        for page in self.pages:
+            if page.error is not None:
+                lines.append('ERR %8.2fms %s' % (
+                        page.duration * 1000, page.url))
+            else:
+                lines.append('%3d %8.2fms %8d %s' % (
+                        page.status_code, page.duration * 1000,
+                        page.size or 0, page.url))
+        return '\n'.join(lines)
+
+    def __iter__(self):
+        return iter(self.pages)
+
+    def __len__(self):
+        return len(self.pages)
+
+
+def find_urls(browser):
+    """Return the resolved URLs of the links and GET forms of the
+    current page.
+    """
+    html = browser.html
+    if html is None:
+        return []
+    urls = map(lambda href: resolve_url(href, browser),
+               html.xpath('//a/@href'))
+    for node in html.xpath('//form'):
+        form = Form(node, browser)
+        if form.method == 'GET':
+            # Like a submit, the query replaces the one of the action.
+            info = urlparse.urlparse(form.action)
+            query = urllib.urlencode(form.serialize())
+            urls.append(urlparse.urlunparse(
+                    info[:4] + (query or info.query, info.fragment)))
+    return urls
+
+
+class Crawler(object):
+    """Crawl a WSGI application breadth-first, following links and GET
+    forms, with a pool of browsers sharing the same cookies.
+    """
+
+    def __init__(self, app, size=4, setup=None, max_depth=None,
+                 max_pages=None):
+        self.size = size
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.cookies = Cookies()
+        self.browsers = []
+        for index in range(size):
+            browser = Browser(app)
+            browser.options.multithread = True
+            browser.cookies = self.cookies
+            if setup is not None:
+                setup(browser)
+            self.browsers.append(browser)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def crawl(self, start_url='/'):
+        """Visit ``start_url`` and all the pages that can be reached
+        from it, and return a report.
+        """
+        queue = Queue.Queue()
+        lock = threading.Lock()
+        pages = []
+        seen = set()
+
+        def schedule(url, depth, referrer, browser):
+            url = canonical_url(url, browser.options)
+            if url is None:
+                return
+            with lock:
+                if url in seen:
+                    return
+                if self.max_pages is not None and len(pages) >= self.max_pages:
+                    return
+                seen.add(url)
+                page = CrawledPage(url, depth, referrer)
+                pages.append(page)
+            queue.put(page)
+
+        def visit(browser, page):
+            start = default_timer()
+            try:
+                page.status_code = browser.open(page.url)
+                page.size = browser.decoded_size
+                page.duration = default_timer() - start
+                with lock:
+                    # Don't visit a page reached by a redirect again.
+                    seen.add(browser.url)
+                if self.max_depth is None or page.depth < self.max_depth:
+                    for url in find_urls(browser):
+                        schedule(url, page.depth + 1, page.url, browser)
+            except Exception:
+                page.error = traceback.format_exc()
+                page.duration = default_timer() - start
+
+        def worker(browser):
+            while True:
+                page = queue.get()
+                try:
+                    if page is None:
+                        return
+                    visit(browser, page)
+                finally:
+                    queue.task_done()
+
+        start = default_timer()
+        schedule(start_url, 0, None, self.browsers[0])
+        threads = []
+        for browser in self.browsers:
+            thread = threading.Thread(target=worker, args=(browser,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        queue.join()
+        for thread in threads:
+            queue.put(None)
+        for thread in threads:
+            thread.join()
+        return CrawlReport(pages, default_timer() - start)
+
+    def close(self):
+        for browser in self.browsers:
+            browser.close()
+
+
+def crawl(app, start_url='/', **options):
+    """Crawl a WSGI application from ``start_url``, and return a
+    report. ``options`` are given to the ``Crawler``.
+    """
+    with Crawler(app, **options) as crawler:
+        return crawler.crawl(start_url)
@@ -132,6 +132,11 @@ class Expressions(object):
                 u'You need to provide an XPath or CSS expression')
         self.__expressions[name] = (finder, type, unique)
 
+    def copy(self, browser):
+        expressions = Expressions(browser)
+        expressions.__expressions.update(self.__expressions)
+        return expressions
+
     def __getattr__(self, name):
         finder, type, unique = self.__expressions[name]
         if finder is not None:
@@ -352,7 +352,10 @@ class Form(object):
             raise AssertionError(u'No control %s' % name)
         return self.controls.get(name)
 
-    def submit(self, name=None, value=None):
+    def serialize(self, name=None, value=None):
+        """Return the list of names and values that would be sent
+        by submitting the form.
+        """
         form = []
         encoder = functools.partial(charset_encoder, self.accept_charset[0])
         if name is not None:
@@ -361,10 +364,13 @@ class Form(object):
             form.append((name, value))
         for submitter in self.__control_submits:
             form.extend(submitter(encoder))
+        return form
+
+    def submit(self, name=None, value=None):
         return self.__browser.open(
             self.action,
             method=self.method,
-            form=form,
+            form=self.serialize(name, value),
             form_charset=self.accept_charset[0],
             form_enctype=self.enctype)
 
@@ -3,12 +3,26 @@
 # See also LICENSE.txt
 
 
+CGI_HEADER_NAMES = {}
+
+
 def format_http_header(name):
     """This format an http header key.
     """
     return '-'.join(map(lambda s: s.capitalize(), name.split('-')))
 
 
+def format_cgi_header(name):
+    """This format an http header key as a CGI environment key. Results
+    are memoized, as the same few headers are used over and over.
+    """
+    key = CGI_HEADER_NAMES.get(name)
+    if key is None:
+        key = ('HTTP_' + name.upper()).replace('-', '_')
+        CGI_HEADER_NAMES[name] = key
+    return key
+
+
 class HTTPHeaders(dict):
     """Implement a case insensitive dictionary to store HTTP headers.
     """
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import collections
+import zlib
+
+from infrae.testbrowser.interfaces import IHistory, IHistoryEntry
+
+from zope.interface import implements
+
+
+class HistoryEntry(object):
+    """A previously viewed page.
+    """
+    implements(IHistoryEntry)
+
+    def __init__(self, history, url, method, status, headers):
+        self.__history = history
+        self.url = url
+        self.method = method
+        self.status = status
+        self.headers = headers
+
+    @property
+    def contents(self):
+        return self.__history.get_contents(self)
+
+    def __repr__(self):
+        return '<%s %s>' % (self.method, self.url)
+
+
+class History(object):
+    """Browsing history. It keeps the status and headers of the last
+    viewed pages, and optionally the compressed payload of the most
+    recently used ones, within a byte budget.
+    """
+    implements(IHistory)
+
+    def __init__(self, options):
+        self.__options = options
+        self.__entries = collections.deque()
+        self.__contents = collections.OrderedDict()
+        self.size = 0
+
+    def append(self, url, method, response):
+        entry = HistoryEntry(
+            self, url, method, response.status, response.headers)
+        self.__entries.append(entry)
+        while len(self.__entries) > self.__options.history_length:
+            self.__discard(self.__entries.popleft())
+        if self.__options.history_bodies and response.stream is None:
+            data = zlib.compress(response.getvalue())
+            self.__contents[entry] = data
+            self.size += len(data)
+            self.__evict()
+        return entry
+
+    def get_contents(self, entry):
+        data = self.__contents.pop(entry, None)
+        if data is None:
+            return None
+        # Mark it as the most recently used.
+        self.__contents[entry] = data
+        return zlib.decompress(data)
+
+    def __discard(self, entry):
+        data = self.__contents.pop(entry, None)
+        if data is not None:
+            self.size -= len(data)
+
+    def __evict(self):
+        max_size = self.__options.history_max_size
+        while self.__contents and (
+            len(self.__contents) > self.__options.history_bodies or
+            (max_size is not None and self.size > max_size)):
+            self.__discard(next(iter(self.__contents)))
+
+    def copy(self, options):
+        """Return a copy of the history, using ``options``.
+        """
+        history = History(options)
+        copies = {}
+        for entry in self.__entries:
+            copies[entry] = HistoryEntry(
+                history, entry.url, entry.method, entry.status, entry.headers)
+            history.__entries.append(copies[entry])
+        for entry, data in self.__contents.items():
+            history.__contents[copies[entry]] = data
+        history.size = self.size
+        return history
+
+    def urls(self):
+        return map(lambda e: e.url, self.__entries)
+
+    def clear(self):
+        self.__entries.clear()
+        self.__contents.clear()
+        self.size = 0
+
+    def __getitem__(self, index):
+        return self.__entries[index]
+
+    def __iter__(self):
+        return iter(self.__entries)
+
+    def __len__(self):
+        return len(self.__entries)
@@ -77,8 +77,21 @@ class IAdvancedBrowser(IBrowser):
     content_encoding = Attribute(u"Content encoding")
     headers = Attribute(u"Dictionary like access to response headers")
     history = Attribute(u"Last previously viewed URLs")
+    history_entries = Attribute(u"Last previously viewed pages")
+    redirects = Attribute(u"URLs that redirected to the current page")
     xml = Attribute(u"XML payload parsed by LXML, or None")
     json = Attribute(u"JSON payload parsed, or None")
+    stream = Attribute(u"File-like access to a streamed payload, or None")
+    timings = Attribute(u"Time spent in each phase of the last request")
+    total_timings = Attribute(u"Time spent in each phase of all requests")
+    profiles = Attribute(u"Profiling data of the application")
+    memory = Attribute(u"Memory allocations made by the requests")
+    cache = Attribute(u"Private HTTP cache")
+    documents = Attribute(u"Cache of parsed documents")
+    wire_size = Attribute(u"Size of the payload sent by the application")
+    decoded_size = Attribute(u"Size of the payload once decoded")
+    page_weight = Attribute(u"Weight of the page with its resources, or None")
+    statistics = Attribute(u"Counters and histograms of all the requests")
 
     def set_request_header(key, value):
         """Set an HTTP header ``key`` to the given ``value`` for each
@@ -100,8 +113,34 @@ class IAdvancedBrowser(IBrowser):
         server each time a request is made.
         """
 
+    def iter_xml(tag=None, path=None):
+        """Parse the XML payload as it is read, and iterate over the
+        elements matching ``tag`` and ``path``. The elements are
+        cleared after they have been seen.
+        """
+
+    def iter_json(path=None):
+        """Decode the JSON payload as it is read, and iterate over
+        the values under ``path`` (keys separated with dots, ``*``
+        matching all the items of an array or object).
+        """
+
+    def open_many(requests, concurrency=1):
+        """Make each of the requests (URLs, or dictionaries with the
+        arguments of ``open``) without changing the current page, and
+        return the responses in the same order. Redirects are not
+        followed, and cookies set by the responses are ignored.
+        """
+
+    def fork():
+        """Return a new browser on the same application, with a copy
+        of the options, cookies, request headers, current page and
+        history, that can be used independently.
+        """
+
     def open(url, method='GET', query=None,
-             form=None, form_enctype='application/x-www-form-urlencoded'):
+             form=None, form_enctype='application/x-www-form-urlencoded',
+             data=None, data_type=None, stream=False):
         pass
 
 
@@ -157,6 +196,45 @@ class ICookies(Interface):
         """
 
 
+# History support
+
+
+class IHistoryEntry(Interface):
+    """Represent a previously viewed page.
+    """
+    url = Attribute(u"Viewed URL")
+    method = Attribute(u"Method used to view the page")
+    status = Attribute(u"HTTP status")
+    headers = Attribute(u"Response headers")
+    contents = Attribute(u"Payload, or None if it was not kept")
+
+
+class IHistory(Interface):
+    """Represent the last viewed pages.
+    """
+
+    def urls():
+        """List the viewed URLs, the oldest first.
+        """
+
+    def copy(options):
+        """Return an independent copy of the history, using the
+        given browser ``options``.
+        """
+
+    def clear():
+        """Forget all the viewed pages.
+        """
+
+    def __getitem__(index):
+        """Return an entry.
+        """
+
+    def __len__():
+        """Return the number of entries.
+        """
+
+
 # Form support
 
 class IFormControl(Interface):
@@ -233,21 +311,209 @@ class IWSGIResponse(Interface):
     status = Attribute(u'HTTP status line')
     headers = Attribute(u'Response headers')
     output = Attribute(u'Response data (except headers)')
+    stream = Attribute(u'Streamed response data, or None')
+    document = Attribute(u'HTML document parsed while the data was '
+                         u'received, or None')
+    timings = Attribute(u'Time spent in each phase of the response')
+    wire_size = Attribute(u'Size of the data sent by the application')
+    size = Attribute(u'Size of the data once decoded')
+
+    def getfile():
+        """Return the response data as a file, consuming it if it is
+        streamed.
+        """
+
+    def getvalue():
+        """Return the response data, consuming it if it is streamed.
+        """
+
+    def close():
+        """Release the application iterable. The response data can
+        still be read.
+        """
+
+
+class IProfiles(Interface):
+    """Profiling data of an application, accumulated by path.
+    """
+
+    def keys():
+        """List the profiled paths.
+        """
+
+    def __getitem__(path):
+        """Return the ``pstats.Stats`` collected for ``path``.
+        """
+
+    def print_stats(path, sort='cumulative', *restrictions):
+        """Print the data collected for ``path``.
+        """
+
+    def dump(directory):
+        """Write the data for each path in ``directory``.
+        """
+
+    def clear():
+        """Forget all the collected data.
+        """
+
+
+class IMemoryTracer(Interface):
+    """Attribute memory allocations to requests.
+    """
+
+    def report(limit=10):
+        """Return for each URL and phase the top ``limit`` allocation
+        sites with their size.
+        """
+
+    def format(limit=10):
+        """Return the report as text.
+        """
+
+    def clear():
+        """Forget all the collected data.
+        """
+
+
+class IHTTPCache(Interface):
+    """Private HTTP cache.
+    """
+    hits = Attribute(u'Number of requests served from the cache')
+    misses = Attribute(u'Number of requests not served from the cache')
+    revalidations = Attribute(u'Number of entries revalidated')
+
+    def __len__():
+        """Return the number of stored responses.
+        """
+
+    def clear():
+        """Remove all stored responses.
+        """
+
+
+class ICassette(Interface):
+    """Recorded interactions with an application.
+    """
+    path = Attribute(u'Path of the cassette file')
+    mode = Attribute(u'Mode: auto, record or replay')
+    match = Attribute(u'Request fields used to match a recorded request')
+
+    def play(method, uri, headers, data=None):
+        """Return a WSGI application replaying the recorded response
+        to the request, or None.
+        """
+
+    def record(method, uri, headers, data, app):
+        """Return a WSGI application calling ``app`` and recording
+        its response.
+        """
+
+    def save():
+        """Append the interactions recorded since the last call to
+        the cassette file.
+        """
+
+    def __len__():
+        """Return the number of recorded interactions.
+        """
+
+
+class IPageWeight(Interface):
+    """Weight of a page, with all its images, scripts and
+    stylesheets.
+    """
+    document_size = Attribute(u'Size of the page payload')
+    resources = Attribute(u'Resources loaded by the page')
+    size = Attribute(u'Size of the page and of all its resources')
+    transferred = Attribute(u'Size of the page and of the resources '
+                            u'that were not already loaded')
+    requests = Attribute(u'Number of requests made to load the page')
+    duration = Attribute(u'Time spent to load the page')
+    errors = Attribute(u'Resources that could not be loaded')
+
+
+class IDocumentCache(Interface):
+    """Parsed documents, stored by a hash of their payload.
+    """
+    hits = Attribute(u'Number of documents that were not parsed')
+    misses = Attribute(u'Number of documents that were parsed')
+
+    def __len__():
+        """Return the number of stored documents.
+        """
+
+    def clear():
+        """Remove all stored documents.
+        """
+
+
+class IStatistics(Interface):
+    """Cumulative counters and histograms.
+    """
+    parent = Attribute(u"Statistics receiving the values as well, or None")
+
+    def increment(name, value=1, **labels):
+        """Add ``value`` to the counter ``name`` with ``labels``.
+        """
+
+    def observe(name, value, **labels):
+        """Add ``value`` to the histogram ``name`` with ``labels``.
+        """
+
+    def get(name, **labels):
+        """Return the value of a counter, or the number of values
+        observed by an histogram.
+        """
+
+    def total(name):
+        """Return the value of a counter summed over all its labels.
+        """
+
+    def format():
+        """Return the statistics in the Prometheus text format.
+        """
+
+    def as_dict():
+        """Return the statistics as a dictionary.
+        """
+
+    def write(path, format='prometheus'):
+        """Write the statistics to ``path``, in the Prometheus text
+        format or in JSON.
+        """
+
+    def clear():
+        """Reset all the counters and histograms.
+        """
 
 
 class IWSGIServer(Interface):
     server = Attribute(u'Server hostname')
     port = Attribute(u'Server port')
     protocol = Attribute(u'HTTP procotol version')
+    profiles = Attribute(u'Profiling data of the application')
+
+    def get_cassette():
+        """Return the cassette used to record or replay the
+        interactions with the application, or None.
+        """
+
+    def close():
+        """Save the interactions recorded in the cassette.
+        """
 
     def get_default_environ():
         pass
 
-    def get_environ(method, uri, headers, data=None, data_type=None):
+    def get_environ(method, uri, headers, data=None, data_type=None,
+                    multithread=False):
         pass
 
-    def __call__(method, uri, headers, data=None, data_type=None):
+    def __call__(method, uri, headers, data=None, data_type=None,
+                 stream=False, multithread=False):
         """Compute the a response for the query. This return a
-        IWSGIResponse object.
+        IWSGIResponse object. ``multithread`` tells that the query is
+        made concurrently with others.
         """
 
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import collections
+import math
+import re
+import urlparse
+
+from infrae.testbrowser.pool import BrowserPool
+
+
+Sample = collections.namedtuple(
+    'Sample', ('method', 'url', 'pattern', 'status_code', 'duration'))
+
+
+class Latencies(object):
+    """Latency statistics for a group of requests.
+    """
+
+    def __init__(self, durations):
+        self.durations = sorted(durations)
+
+    @property
+    def count(self):
+        return len(self.durations)
+
+    @property
+    def mean(self):
+        if not self.durations:
+            return 0.0
+        return sum(self.durations) / len(self.durations)
+
+    @property
+    def max(self):
+        if not self.durations:
+            return 0.0
+        return self.durations[-1]
+
+    def percentile(self, percent):
+        """Return the given percentile (nearest rank) in seconds.
+        """
+        if not self.durations:
+            return 0.0
+        rank = int(math.ceil(percent / 100.0 * len(self.durations)))
+        return self.durations[max(rank, 1) - 1]
+
+    @property
+    def p50(self):
+        return self.percentile(50)
+
+    @property
+    def p95(self):
+        return self.percentile(95)
+
+    @property
+    def p99(self):
+        return self.percentile(99)
+
+    def __repr__(self):
+        return '<%d requests p50=%.4fs p95=%.4fs p99=%.4fs>' % (
+            self.count, self.p50, self.p95, self.p99)
+
+
+class LoadReport(object):
+    """Report of a load test.
+    """
+
+    def __init__(self, samples, results):
+        self.samples = samples
+        self.results = results
+        self.duration = results.duration
+
+    @property
+    def requests(self):
+        return len(self.samples)
+
+    @property
+    def requests_per_second(self):
+        if not self.duration:
+            return 0.0
+        return len(self.samples) / self.duration
+
+    @property
+    def errors(self):
+        return self.results.errors
+
+    @property
+    def latencies(self):
+        return Latencies(map(lambda s: s.duration, self.samples))
+
+    def __group(self, key):
+        groups = collections.defaultdict(list)
+        for sample in self.samples:
+            groups[key(sample)].append(sample.duration)
+        return dict(map(
+            lambda (name, durations): (name, Latencies(durations)),
+            groups.items()))
+
+    @property
+    def by_url(self):
+        return self.__group(lambda s: s.pattern)
+
+    @property
+    def by_status(self):
+        return self.__group(lambda s: s.status_code)
+
+    def format(self):
+        lines = ['%d requests in %.2fs (%.1f requests/s), %d failed runs' % (
+                self.requests, self.duration, self.requests_per_second,
+                len(self.errors))]
+        for title, groups in (('URL', self.by_url),
+                              ('Status', self.by_status)):
+            lines.append('%-40s %8s %10s %10s %10s' % (
+                    title, 'count', 'p50', 'p95', 'p99'))
+            for name, latencies in sorted(groups.items()):
+                lines.append('%-40s %8d %9.4fs %9.4fs %9.4fs' % (
+                        name, latencies.count, latencies.p50,
+                        latencies.p95, latencies.p99))
+        return '\n'.join(lines)
+
+    __str__ = format
+
+
+class LoadTest(object):
+    """Replay a scenario with ``users`` concurrent browsers, and time
+    every request made to the application.
+
+    ``patterns`` is a list of ``(name, regular expression)`` used to
+    group requests URLs in the report. Requests that don't match any
+    pattern are grouped by path.
+    """
+
+    def __init__(self, app, scenario, users=10, patterns=None, setup=None):
+        self.app = app
+        self.scenario = scenario
+        self.users = users
+        self.setup = setup
+        self.patterns = map(
+            lambda (name, pattern): (name, re.compile(pattern)),
+            patterns or [])
+
+    def get_pattern(self, url):
+        for name, pattern in self.patterns:
+            if pattern.search(url):
+                return name
+        return urlparse.urlparse(url).path
+
+    def run(self, iterations=None, duration=None):
+        """Run the scenario ``iterations`` times, or during
+        ``duration`` seconds, and return a report.
+        """
+        samples = []
+
+        def record(browser, method, url, response, duration):
+            status = response.status
+            samples.append(Sample(
+                    method, url, self.get_pattern(url),
+                    int(status.split(' ', 1)[0]) if status else None,
+                    duration))
+
+        def setup(browser):
+            if self.setup is not None:
+                self.setup(browser)
+            browser.handlers.add('query', record, unique=True)
+
+        with BrowserPool(self.app, size=self.users, setup=setup) as pool:
+            results = pool.run(
+                self.scenario, iterations=iterations, duration=duration)
+        return LoadReport(samples, results)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import gc
+import os
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2 requires pytracemalloc, objects are measured instead.
+    tracemalloc = None
+
+from infrae.testbrowser.interfaces import IMemoryTracer
+
+from zope.interface import implements
+
+PACKAGE_PATH = os.path.dirname(os.path.abspath(__file__))
+TESTS_PATH = os.path.join(PACKAGE_PATH, 'tests')
+
+
+def source_file(filename):
+    """Return the source file of a module file, that can be a
+    compiled one.
+    """
+    base, extension = os.path.splitext(filename)
+    if extension in ('.pyc', '.pyo'):
+        return base + '.py'
+    return filename
+
+
+def is_browser_frame(filename):
+    """Tell if an allocation made in ``filename`` is made by the
+    browser itself (test applications are not part of it).
+    """
+    filename = os.path.abspath(filename)
+    return (filename.startswith(PACKAGE_PATH) and
+            not filename.startswith(TESTS_PATH))
+
+
+class ObjectSnapshot(object):
+    """Size of the objects tracked by the garbage collector, by
+    type. It is used when tracemalloc is not available: allocations
+    are then reported by type instead of by line.
+    """
+
+    def __init__(self):
+        gc.collect()
+        sizes = {}
+        for obj in gc.get_objects():
+            cls = type(obj)
+            if cls.__module__ in ('__builtin__', 'builtins'):
+                name = cls.__name__
+            else:
+                name = '%s.%s' % (cls.__module__, cls.__name__)
+            sizes[name] = sizes.get(name, 0) + sys.getsizeof(obj)
+        self.sizes = sizes
+
+    def compare_to(self, before):
+        """Return the list of types and their size difference.
+        """
+        return map(lambda (name, size): (
+                name, size - before.sizes.get(name, 0)),
+            self.sizes.items())
+
+
+class MemoryTracer(object):
+    """Attribute memory allocations to the requests made by a
+    browser, using tracemalloc snapshots. Allocations made while the
+    application is called are attributed to the ``application``, and
+    allocations made by the browser while a page is viewed (payload,
+    parsing, forms) are attributed to the ``browser``. Without
+    tracemalloc, the growth of the objects by type is reported, the
+    one of the application being removed from the one of the browser.
+    """
+    implements(IMemoryTracer)
+
+    def __init__(self):
+        self.__sites = {}
+        self.__window = None
+        self.__application = {}
+
+    def snapshot(self):
+        if tracemalloc is None:
+            return ObjectSnapshot()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, source_file(tracemalloc.__file__)),
+             tracemalloc.Filter(False, source_file(__file__))))
+
+    def record(self, url, phase, before, after=None):
+        """Record the net allocations between the snapshots ``before``
+        and ``after`` (default to now) for ``url``.
+        """
+        if after is None:
+            after = self.snapshot()
+        browser = phase == 'browser'
+        sites = self.__sites.setdefault(url, {}).setdefault(phase, {})
+        if isinstance(after, ObjectSnapshot):
+            for site, size in after.compare_to(before):
+                if browser:
+                    # The application was called while the page was
+                    # viewed, its objects are not made by the browser.
+                    size -= self.__application.get(site, 0)
+                else:
+                    self.__application[site] = (
+                        self.__application.get(site, 0) + size)
+                if size > 0:
+                    sites[site] = sites.get(site, 0) + size
+            return after
+        for stat in after.compare_to(before, 'lineno'):
+            frame = stat.traceback[0]
+            if stat.size_diff <= 0 or (
+                is_browser_frame(frame.filename) != browser):
+                continue
+            site = '%s:%d' % (frame.filename, frame.lineno)
+            sites[site] = sites.get(site, 0) + stat.size_diff
+        return after
+
+    def checkpoint(self, url):
+        """Record the allocations made by the browser while ``url``
+        was viewed, and start a new viewing window.
+        """
+        now = self.snapshot()
+        if self.__window is not None and url is not None:
+            self.record(url, 'browser', self.__window, now)
+        self.__window = now
+        self.__application = {}
+
+    def report(self, limit=10):
+        """Return for each URL and phase the top ``limit`` allocation
+        sites, as a list of ``(site, size in bytes)``.
+        """
+        report = {}
+        for url, phases in self.__sites.items():
+            report[url] = {}
+            for phase, sites in phases.items():
+                report[url][phase] = sorted(
+                    sites.items(), key=lambda s: s[1], reverse=True)[:limit]
+        return report
+
+    def format(self, limit=10):
+        lines = []
+        for url, phases in sorted(self.report(limit).items()):
+            lines.append(url)
+            for phase, sites in sorted(phases.items()):
+                for site, size in sites:
+                    lines.append('  %-12s %10.1f KiB  %s' % (
+                            phase, size / 1024.0, site))
+        return '\n'.join(lines)
+
+    def clear(self):
+        self.__sites = {}
+        self.__window = None
+        self.__application = {}
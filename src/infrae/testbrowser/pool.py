@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import cPickle
+import itertools
+import multiprocessing
+import os
+import threading
+import traceback
+
+from timeit import default_timer
+
+from infrae.testbrowser.browser import Browser
+
+
+class ScenarioResult(object):
+    """Outcome of one run of a scenario.
+    """
+
+    def __init__(self, worker, iteration, value=None, error=None,
+                 duration=0.0):
+        self.worker = worker
+        self.iteration = iteration
+        self.value = value
+        self.error = error
+        self.duration = duration
+
+    def __repr__(self):
+        if self.error is not None:
+            return '<failed run %d on worker %d>' % (
+                self.iteration, self.worker)
+        return '<run %d on worker %d: %r>' % (
+            self.iteration, self.worker, self.value)
+
+
+class ScenarioResults(object):
+    """Results of all the runs of a scenario, ordered by iteration.
+    """
+
+    def __init__(self, results, duration):
+        self.results = sorted(results, key=lambda r: r.iteration)
+        self.duration = duration
+
+    @property
+    def values(self):
+        return map(lambda r: r.value,
+                   filter(lambda r: r.error is None, self.results))
+
+    @property
+    def errors(self):
+        return filter(lambda r: r.error is not None, self.results)
+
+    @property
+    def throughput(self):
+        """Number of runs per second.
+        """
+        if not self.duration:
+            return 0.0
+        return len(self.results) / self.duration
+
+    def check(self):
+        """Raise an AssertionError if any of the runs failed.
+        """
+        errors = self.errors
+        if errors:
+            raise AssertionError(
+                u'%d run(s) out of %d failed, first error:\n%s' % (
+                    len(errors), len(self.results), errors[0].error))
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+
+def run_scenario(worker, browser, scenario, iteration):
+    start = default_timer()
+    try:
+        value = scenario(browser)
+    except Exception:
+        return ScenarioResult(
+            worker, iteration,
+            error=traceback.format_exc(),
+            duration=default_timer() - start)
+    return ScenarioResult(
+        worker, iteration,
+        value=value,
+        duration=default_timer() - start)
+
+
+class BrowserPool(object):
+    """Run a scenario with a pool of browsers, each one in its own
+    thread, against the same WSGI application. Each browser has its
+    own cookies and headers.
+    """
+
+    def __init__(self, app, size=4, setup=None):
+        self.size = size
+        self.browsers = []
+        for index in range(size):
+            browser = Browser(app)
+            browser.options.multithread = True
+            if setup is not None:
+                setup(browser)
+            self.browsers.append(browser)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def run(self, scenario, iterations=None, duration=None):
+        """Call ``scenario`` with a browser ``iterations`` times, or
+        during ``duration`` seconds, distributing the calls over the
+        threads, and return the results. By default, ``scenario`` is
+        called once per browser.
+        """
+        if iterations is None and duration is None:
+            iterations = self.size
+        counter = itertools.count()
+        lock = threading.Lock()
+        results = []
+        start = default_timer()
+        deadline = None
+        if duration is not None:
+            deadline = start + duration
+
+        def next_iteration():
+            with lock:
+                iteration = next(counter)
+            if iterations is not None and iteration >= iterations:
+                return None
+            if deadline is not None and default_timer() >= deadline:
+                return None
+            return iteration
+
+        def worker(index, browser):
+            iteration = next_iteration()
+            while iteration is not None:
+                results.append(
+                    run_scenario(index, browser, scenario, iteration))
+                iteration = next_iteration()
+
+        threads = []
+        for index, browser in enumerate(self.browsers):
+            thread = threading.Thread(target=worker, args=(index, browser))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return ScenarioResults(results, default_timer() - start)
+
+    def close(self):
+        for browser in self.browsers:
+            browser.close()
+
+
+class WorkerProcess(object):
+    """A forked process of a pool, sending its results in a pipe.
+    """
+
+    def __init__(self, index, pid, iterations, fd):
+        self.index = index
+        self.pid = pid
+        self.iterations = iterations
+        self.status = None
+        self.error = None
+        self.__fd = fd
+        self.__done = set()
+
+    def read(self):
+        """Read the results sent by the process until it exits, or
+        until they cannot be read anymore.
+        """
+        results = []
+        input = os.fdopen(self.__fd, 'rb')
+        self.__fd = None
+        try:
+            while True:
+                try:
+                    result = cPickle.load(input)
+                except EOFError:
+                    break
+                except Exception:
+                    # The process died, or sent something that cannot
+                    # be read, while writing a result.
+                    self.error = traceback.format_exc()
+                    break
+                self.__done.add(result.iteration)
+                results.append(result)
+        finally:
+            input.close()
+        return results
+
+    def wait(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+        _, self.status = os.waitpid(self.pid, 0)
+
+    def failures(self):
+        """Return a failed result for each iteration that was not
+        received.
+        """
+        message = u'Worker process %d exited with status %d' % (
+            self.pid, self.status)
+        if self.error is not None:
+            message += u', its results could not be read:\n' + self.error
+        return map(
+            lambda iteration: ScenarioResult(
+                self.index, iteration, error=message),
+            filter(lambda iteration: iteration not in self.__done,
+                   self.iterations))
+
+
+class ProcessPool(object):
+    """Run a scenario with browsers in forked processes, against a WSGI
+    application loaded only once in the parent process.
+    """
+
+    def __init__(self, app, size=None, setup=None):
+        if not hasattr(os, 'fork'):
+            raise AssertionError(u'Process pools require os.fork')
+        self.app = app
+        self.size = size or multiprocessing.cpu_count()
+        self.setup = setup
+
+    def __worker(self, index, scenario, iterations, output):
+        # Run in the forked process.
+        try:
+            browser = Browser(self.app)
+            browser.options.multiprocess = True
+            if self.setup is not None:
+                self.setup(browser)
+            for iteration in iterations:
+                result = run_scenario(index, browser, scenario, iteration)
+                try:
+                    data = cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+                except Exception:
+                    result.value = repr(result.value)
+                    data = cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+                output.write(data)
+            browser.close()
+        finally:
+            output.close()
+
+    def run(self, scenario, iterations=None):
+        """Call ``scenario`` with a browser ``iterations`` times
+        (default to once per process), distributing the calls over the
+        processes, and return the results.
+        """
+        if iterations is None:
+            iterations = self.size
+        workers = []
+        results = []
+        start = default_timer()
+        try:
+            for index in range(min(self.size, iterations)):
+                worker_iterations = range(index, iterations, self.size)
+                read_fd, write_fd = os.pipe()
+                pid = os.fork()
+                if not pid:
+                    os.close(read_fd)
+                    status = 0
+                    try:
+                        self.__worker(
+                            index, scenario, worker_iterations,
+                            os.fdopen(write_fd, 'wb'))
+                    except:
+                        traceback.print_exc()
+                        status = 1
+                    os._exit(status)
+                os.close(write_fd)
+                workers.append(
+                    WorkerProcess(index, pid, worker_iterations, read_fd))
+            for worker in workers:
+                results.extend(worker.read())
+        finally:
+            # Always reap all the children.
+            for worker in workers:
+                worker.wait()
+
+        for worker in workers:
+            results.extend(worker.failures())
+        return ScenarioResults(results, default_timer() - start)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import cProfile
+import os
+import pstats
+import re
+import urllib
+
+from infrae.testbrowser.interfaces import IProfiles
+
+from zope.interface import implements
+
+
+class Profiles(object):
+    """Profiling data of the application, accumulated by path.
+    """
+    implements(IProfiles)
+
+    def __init__(self):
+        self.__stats = {}
+
+    def profile(self, path, function, *args):
+        """Call ``function`` with ``args`` under the profiler, and
+        accumulate the result for ``path``.
+        """
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(function, *args)
+        finally:
+            if path in self.__stats:
+                self.__stats[path].add(profiler)
+            else:
+                self.__stats[path] = pstats.Stats(profiler)
+
+    def keys(self):
+        return sorted(self.__stats.keys())
+
+    def __getitem__(self, path):
+        return self.__stats[path]
+
+    def __contains__(self, path):
+        return path in self.__stats
+
+    def __len__(self):
+        return len(self.__stats)
+
+    def print_stats(self, path, sort='cumulative', *restrictions):
+        self.__stats[path].sort_stats(sort).print_stats(*restrictions)
+
+    def dump(self, directory):
+        """Write the data for each path in a pstats file in
+        ``directory``, and return the created filenames.
+        """
+        filenames = []
+        for path in self.keys():
+            name = urllib.quote(path.strip('/') or 'index', safe='')
+            filename = os.path.join(directory, name + '.prof')
+            self.__stats[path].dump_stats(filename)
+            filenames.append(filename)
+        return filenames
+
+    def clear(self):
+        self.__stats = {}
+
+
+def should_profile(option, path):
+    """Tell if a request to ``path`` must be profiled according to the
+    option ``profile`` (``True`` or a regular expression).
+    """
+    if option is True:
+        return True
+    if option:
+        return re.search(option, path) is not None
+    return False
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import atexit
+import bisect
+import json
+import os
+import threading
+
+from infrae.testbrowser.interfaces import IStatistics
+
+from zope.interface import implements
+
+STATISTICS_PREFIX = 'testbrowser_'
+STATISTICS_FORMATS = ('prometheus', 'json')
+DURATION_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(map(
+            lambda (name, value): '%s="%s"' % (
+                name, unicode(value).replace('\\', '\\\\').replace(
+                    '"', '\\"').replace('\n', '\\n')),
+            labels))
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class Histogram(object):
+    """Distribution of observed values in cumulative buckets.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Return the list of upper bounds and number of values below
+        them, the last bound being infinite.
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Statistics(object):
+    """Cumulative counters and histograms, identified by a name and
+    labels. Values are added to the ``parent`` statistics as well.
+    """
+    implements(IStatistics)
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.__lock = threading.Lock()
+        self.__counters = {}
+        self.__histograms = {}
+
+    def __key(self, name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def increment(self, name, value=1, **labels):
+        key = self.__key(name, labels)
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+        if self.parent is not None:
+            self.parent.increment(name, value, **labels)
+
+    def observe(self, name, value, **labels):
+        key = self.__key(name, labels)
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = self.__histograms[key] = Histogram()
+            histogram.observe(value)
+        if self.parent is not None:
+            self.parent.observe(name, value, **labels)
+
+    def get(self, name, **labels):
+        """Return the value of a counter, or the number of values
+        observed by an histogram.
+        """
+        key = self.__key(name, labels)
+        with self.__lock:
+            if key in self.__histograms:
+                return self.__histograms[key].count
+            return self.__counters.get(key, 0)
+
+    def total(self, name):
+        """Return the value of a counter summed over all its labels.
+        """
+        with self.__lock:
+            return sum(map(
+                    lambda (key, value): value,
+                    filter(lambda (key, value): key[0] == name,
+                           self.__counters.items())))
+
+    def __group(self, items):
+        groups = {}
+        for (name, labels), value in sorted(items):
+            groups.setdefault(name, []).append((labels, value))
+        return sorted(groups.items())
+
+    def format(self):
+        """Return the statistics in the Prometheus text format.
+        """
+        with self.__lock:
+            counters = self.__group(self.__counters.items())
+            histograms = self.__group(
+                map(lambda (key, histogram): (
+                        key, (histogram.cumulative(),
+                              histogram.sum, histogram.count)),
+                    self.__histograms.items()))
+        lines = []
+        for name, values in counters:
+            name = STATISTICS_PREFIX + name
+            lines.append('# TYPE %s counter' % name)
+            for labels, value in values:
+                lines.append('%s%s %s' % (
+                        name, format_labels(labels), format_value(value)))
+        for name, values in histograms:
+            name = STATISTICS_PREFIX + name
+            lines.append('# TYPE %s histogram' % name)
+            for labels, (buckets, total, count) in values:
+                for bound, cumulated in buckets:
+                    lines.append('%s_bucket%s %d' % (
+                            name,
+                            format_labels(labels, (
+                                    ('le', '+Inf' if bound == float('inf')
+                                     else repr(bound)),)),
+                            cumulated))
+                lines.append('%s_sum%s %s' % (
+                        name, format_labels(labels), repr(total)))
+                lines.append('%s_count%s %d' % (
+                        name, format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+    def as_dict(self):
+        """Return the statistics as a dictionary that can be
+        serialized in JSON.
+        """
+        with self.__lock:
+            counters = self.__group(self.__counters.items())
+            histograms = self.__group(
+                map(lambda (key, histogram): (
+                        key, {'buckets': histogram.cumulative()[:-1],
+                              'sum': histogram.sum,
+                              'count': histogram.count}),
+                    self.__histograms.items()))
+        result = {'counters': {}, 'histograms': {}}
+        for name, values in counters:
+            result['counters'][name] = map(
+                lambda (labels, value): {'labels': dict(labels),
+                                         'value': value},
+                values)
+        for name, values in histograms:
+            result['histograms'][name] = map(
+                lambda (labels, value): dict(value, labels=dict(labels)),
+                values)
+        return result
+
+    def write(self, path, format='prometheus'):
+        """Write the statistics to the file ``path``, in the
+        Prometheus text format or in JSON.
+        """
+        if format not in STATISTICS_FORMATS:
+            raise AssertionError(u'Unknown statistics format %s' % format)
+        if format == 'json':
+            data = json.dumps(self.as_dict(), indent=2, sort_keys=True)
+        else:
+            data = self.format()
+        with open(path, 'wb') as output:
+            output.write(data.encode('utf-8'))
+
+    def clear(self):
+        with self.__lock:
+            self.__counters = {}
+            self.__histograms = {}
+
+
+# Statistics of all the browsers of the process, when they are
+# attached to it (see the option statistics_registry).
+registry = Statistics()
+
+_exports = []
+
+
+def _export():
+    for path, format in _exports:
+        registry.write(path, format)
+
+
+def is_exported():
+    """Return True if the registry is written when the process exits.
+    """
+    return bool(_exports)
+
+
+def export_at_exit(path, format='prometheus'):
+    """Write the statistics of all the browsers to ``path`` when the
+    process exits.
+    """
+    if format not in STATISTICS_FORMATS:
+        raise AssertionError(u'Unknown statistics format %s' % format)
+    if not _exports:
+        atexit.register(_export)
+    _exports.append((path, format))
+
+
+if os.environ.get('TESTBROWSER_STATISTICS'):
+    filename = os.environ['TESTBROWSER_STATISTICS']
+    export_at_exit(
+        filename, 'json' if filename.endswith('.json') else 'prometheus')
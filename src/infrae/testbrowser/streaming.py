@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import json
+import lxml.etree
+
+JSON_WHITESPACE = ' \t\n\r'
+JSON_NUMBER_CONTINUATION = '.eE+-0123456789'
+
+
+def match_tag(expected, tag):
+    """Tell if an element tag matches an expected one. An expected
+    tag without namespace matches the local name of the element.
+    """
+    if expected == '*' or expected == tag:
+        return True
+    if not expected.startswith('{') and isinstance(tag, basestring):
+        return tag.split('}', 1)[-1] == expected
+    return False
+
+
+def match_path(steps, tags):
+    return len(steps) == len(tags) and all(map(match_tag, steps, tags))
+
+
+def iter_xml(source, tag=None, path=None):
+    """Parse an XML document from the file-like ``source``, and
+    yield the elements matching ``tag`` at any depth and ``path`` (a
+    list of tags separated with slashes, starting at the root
+    element). An element is cleared once the next one is requested,
+    with its previous siblings, so that the memory used stays the
+    same whatever the size of the document is.
+    """
+    steps = None
+    if path is not None:
+        steps = filter(None, path.split('/'))
+    tags = []
+    matches = []
+    inside = 0
+    for event, element in lxml.etree.iterparse(
+        source, events=('start', 'end')):
+        if event == 'start':
+            tags.append(element.tag)
+            matched = ((tag is None or match_tag(tag, element.tag)) and
+                       (steps is None or match_path(steps, tags)))
+            matches.append(matched)
+            inside += matched
+            continue
+        if matches.pop():
+            inside -= 1
+            yield element
+        tags.pop()
+        parent = element.getparent()
+        if not inside and parent is not None:
+            # Nobody can access the element anymore.
+            element.clear()
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+class JSONReader(object):
+    """Read JSON values from a file-like object, without loading it
+    entirely in memory.
+    """
+
+    def __init__(self, source, encoding=None, chunk_size=65536):
+        self.__source = source
+        self.__chunk_size = chunk_size
+        self.__decoder = json.JSONDecoder(encoding=encoding)
+        self.__buffer = ''
+        self.__position = 0
+        self.__finished = False
+
+    def __read(self):
+        if self.__finished:
+            return False
+        data = self.__source.read(self.__chunk_size)
+        if not data:
+            self.__finished = True
+            return False
+        self.__buffer = self.__buffer[self.__position:] + data
+        self.__position = 0
+        return True
+
+    def __next_char(self):
+        """Return the next significant character, or None at the end
+        of the payload.
+        """
+        while True:
+            buffer = self.__buffer
+            position = self.__position
+            size = len(buffer)
+            while position < size and buffer[position] in JSON_WHITESPACE:
+                position += 1
+            self.__position = position
+            if position < size:
+                return buffer[position]
+            if not self.__read():
+                return None
+
+    def __expect(self, char):
+        if self.__next_char() != char:
+            raise ValueError(
+                u'Expecting %s at position %d' % (char, self.__position))
+        self.__position += 1
+
+    def decode(self):
+        """Decode the next value.
+        """
+        self.__next_char()
+        while True:
+            try:
+                value, end = self.__decoder.raw_decode(
+                    self.__buffer, self.__position)
+            except ValueError:
+                # The value might not be complete yet.
+                if self.__read():
+                    continue
+                raise
+            if ((end == len(self.__buffer) or
+                 self.__buffer[end] in JSON_NUMBER_CONTINUATION) and
+                self.__read()):
+                # A number might continue in the next chunk.
+                continue
+            self.__position = end
+            return value
+
+    def select(self, steps):
+        """Yield the values under the given path, a list of keys or
+        indexes in which ``*`` match all of them.
+        """
+        if not steps:
+            yield self.decode()
+            return
+        step = steps[0]
+        char = self.__next_char()
+        if char not in ('{', '['):
+            self.decode()
+            return
+        closing = '}' if char == '{' else ']'
+        self.__position += 1
+        index = 0
+        while True:
+            char = self.__next_char()
+            if char is None:
+                raise ValueError(u'Unterminated JSON payload')
+            if char == closing:
+                self.__position += 1
+                return
+            if index:
+                self.__expect(',')
+            if closing == '}':
+                key = self.decode()
+                self.__expect(':')
+            else:
+                key = str(index)
+            if step == '*' or step == key:
+                for value in self.select(steps[1:]):
+                    yield value
+            else:
+                self.decode()
+            index += 1
+
+
+def iter_json(source, path=None, encoding=None):
+    """Decode a JSON payload from the file-like ``source``, and yield
+    the values under ``path``, a list of keys or array indexes
+    separated with dots, where ``*`` matches all of them (for instance
+    ``items.*``). Only one of these values is in memory at a time.
+    """
+    steps = path.split('.') if path else []
+    return JSONReader(source, encoding).select(steps)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import re
+import threading
+import traceback
+
+from timeit import default_timer
+
+from infrae.testbrowser.cache import parse_status_code
+from infrae.testbrowser.interfaces import IPageWeight
+
+from zope.interface import implements
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+?)\1\s*\)''')
+CSS_IMPORT = re.compile(r'''@import\s+(['"])([^'"]+)\1''')
+
+
+def find_css_urls(text):
+    """Return the URLs referenced by a stylesheet.
+    """
+    return map(lambda match: match.group(2).strip(),
+               list(CSS_IMPORT.finditer(text)) + list(CSS_URL.finditer(text)))
+
+
+def find_subresources(html):
+    """Return the type and URL of the images, scripts and stylesheets
+    referenced by an HTML document.
+    """
+    resources = []
+    for url in html.xpath('//img/@src'):
+        resources.append(('image', url))
+    for url in html.xpath('//script/@src'):
+        resources.append(('script', url))
+    for link in html.xpath('//link[@href]'):
+        if 'stylesheet' in link.get('rel', '').lower().split():
+            resources.append(('stylesheet', link.get('href')))
+    for text in html.xpath('//style/text()|//@style'):
+        for url in find_css_urls(text):
+            resources.append(('style', url))
+    return resources
+
+
+class Subresource(object):
+    """A resource loaded by a page.
+    """
+
+    def __init__(self, url, type, status_code=None, size=0, duration=0.0,
+                 cached=False, error=None):
+        self.url = url
+        self.type = type
+        self.status_code = status_code
+        self.size = size
+        self.duration = duration
+        self.cached = cached
+        self.error = error
+
+    def __repr__(self):
+        if self.error is not None:
+            return '<failed %s %s>' % (self.type, self.url)
+        return '<%s %s %s>' % (self.type, self.status_code, self.url)
+
+
+class PageWeight(object):
+    """Weight of a page, with all its resources.
+    """
+    implements(IPageWeight)
+
+    def __init__(self, document_size, resources, duration):
+        self.document_size = document_size or 0
+        self.resources = resources
+        self.duration = duration
+
+    @property
+    def size(self):
+        return self.document_size + sum(map(lambda r: r.size, self.resources))
+
+    @property
+    def transferred(self):
+        return self.document_size + sum(
+            map(lambda r: r.size,
+                filter(lambda r: not r.cached, self.resources)))
+
+    @property
+    def requests(self):
+        return 1 + len(filter(lambda r: not r.cached, self.resources))
+
+    @property
+    def errors(self):
+        return filter(
+            lambda r: r.error is not None or r.status_code >= 400,
+            self.resources)
+
+    def __repr__(self):
+        return '<page of %d bytes in %d requests>' % (
+            self.size, self.requests)
+
+
+class SubresourceFetcher(object):
+    """Fetch the resources of pages concurrently. Each resource is
+    fetched only once, and is reported as cached after.
+    """
+
+    def __init__(self, query, resolve):
+        self.__query = query
+        self.__resolve = resolve
+        self.__fetched = {}
+
+    def __fetch(self, url, type):
+        start = default_timer()
+        resource = Subresource(url, type)
+        urls = []
+        try:
+            response = self.__query(url)
+            try:
+                data = response.getvalue()
+            finally:
+                response.close()
+            resource.status_code = parse_status_code(response.status)
+            resource.size = len(data)
+            content_type = response.headers.get('Content-Type') or ''
+            if content_type.startswith('text/css'):
+                for css_url in find_css_urls(data):
+                    urls.append(('style', self.__resolve(css_url, url)))
+        except Exception:
+            resource.error = traceback.format_exc()
+        resource.duration = default_timer() - start
+        return resource, urls
+
+    def fetch(self, urls, concurrency=4):
+        """Fetch the given list of type and resolved URL, and the
+        resources referenced by the fetched stylesheets. Return the
+        list of fetched resources, in the order they were discovered.
+        """
+        resources = []
+        seen = set()
+        while urls:
+            pending = []
+            discovered = []
+            for type, url in urls:
+                if url is None or url in seen:
+                    continue
+                seen.add(url)
+                if url in self.__fetched:
+                    fetched, found = self.__fetched[url]
+                    resources.append(Subresource(
+                            url, type, fetched.status_code, fetched.size,
+                            cached=True, error=fetched.error))
+                    discovered.extend(found)
+                else:
+                    pending.append((len(resources), url, type))
+                    resources.append(None)
+            urls = discovered
+            lock = threading.Lock()
+            work = iter(pending)
+
+            def worker():
+                while True:
+                    with lock:
+                        item = next(work, None)
+                    if item is None:
+                        return
+                    index, url, type = item
+                    resource, found = self.__fetch(url, type)
+                    with lock:
+                        self.__fetched[url] = resource, found
+                        resources[index] = resource
+                        urls.extend(found)
+
+            threads = []
+            for count in range(min(concurrency, len(pending))):
+                thread = threading.Thread(target=worker)
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+            for thread in threads:
+                thread.join()
+        return resources
+
+    def clear(self):
+        """Forget all the fetched resources.
+        """
+        self.__fetched.clear()
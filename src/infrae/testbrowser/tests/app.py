@@ -2,8 +2,11 @@
 # Copyright (c) 2010-2013 Infrae. All rights reserved.
 # See also LICENSE.txt
 
+import gzip
+import io
 import os
 import urlparse
+import zlib
 
 def encode(value):
     if isinstance(value, unicode):
@@ -58,6 +61,18 @@ def test_app_json(environ, start_response):
     return ['[true, false, 1, "a"]']
 
 
+def test_app_xml(environ, start_response):
+    start_response('200 Ok', [('Content-type', 'text/xml')])
+    return ['<?xml version="1.0" encoding="utf-8"?>',
+            '<feed><entry id="1">First</entry>',
+            '<entry id="2">Second</entry></feed>']
+
+
+def test_app_invalid_json(environ, start_response):
+    start_response('200 Ok', [('Content-type', 'application/json')])
+    return ['[true, false']
+
+
 def test_app_data(environ, start_response):
     start_response('200 Ok', [('Content-type', 'text/html'),])
     return ['<html><ul>',
@@ -117,13 +132,89 @@ class TestAppCount(object):
         return ['<html><p>Call %d, path %s</p></html>' % (count, path)]
 
 
+class TestAppStream(object):
+
+    def __init__(self, chunks=3, size=10):
+        self.chunks = chunks
+        self.size = size
+        self.produced = 0
+        self.closed = False
+
+    def __call__(self, environ, start_response):
+        self.produced = 0
+        self.closed = False
+        start_response('200 Ok', [('Content-type', 'text/plain'),])
+        for index in range(self.chunks):
+            self.produced += 1
+            yield str(index) * self.size
+        self.closed = True
+
+
+class TestAppCache(object):
+
+    def __init__(self, headers=None, etag=None):
+        self.headers = headers or []
+        self.etag = etag
+        self.calls = []
+
+    def __call__(self, environ, start_response):
+        self.calls.append(environ.get('HTTP_IF_NONE_MATCH'))
+        headers = [('Content-type', 'text/html')] + self.headers
+        if self.etag is not None:
+            headers.append(('ETag', self.etag))
+            if environ.get('HTTP_IF_NONE_MATCH') == self.etag:
+                start_response('304 Not Modified', headers)
+                return []
+        start_response('200 Ok', headers)
+        return ['<html><p>Language %s, call %d</p></html>' % (
+                environ.get('HTTP_ACCEPT_LANGUAGE'), len(self.calls))]
+
+
+class TestAppCompress(object):
+
+    def __init__(self, raw_deflate=False):
+        self.raw_deflate = raw_deflate
+
+    def __call__(self, environ, start_response):
+        data = '<html><p>%s</p></html>' % ('Compressed! ' * 100)
+        headers = [('Content-type', 'text/html')]
+        encoding = environ.get('HTTP_ACCEPT_ENCODING', '')
+        if 'gzip' in encoding and environ['PATH_INFO'] != '/deflate.html':
+            output = io.BytesIO()
+            with gzip.GzipFile(fileobj=output, mode='wb') as compressor:
+                compressor.write(data)
+            data = output.getvalue()
+            headers.append(('Content-Encoding', 'gzip'))
+        elif 'deflate' in encoding:
+            data = zlib.compress(data)
+            if self.raw_deflate:
+                data = data[2:-4]
+            headers.append(('Content-Encoding', 'deflate'))
+        start_response('200 Ok', headers)
+        # Send the payload in small chunks.
+        return [data[index:index + 16] for index in range(0, len(data), 16)]
+
+
 class TestAppRedirect(object):
 
     def __init__(self, code='301 Moved Permanently', url='/target.html'):
         self.code = code
         self.url = url
+        self.calls = []
 
     def __call__(self, environ, start_response):
+        self.calls.append(
+            (environ['REQUEST_METHOD'], environ['PATH_INFO'],
+             environ['wsgi.input'].read()))
+        if environ['PATH_INFO'] == '/loop.html':
+            start_response(self.code, [('Location', '/loop.html'),])
+            return []
+        if environ['PATH_INFO'].startswith('/chain/'):
+            step = int(environ['PATH_INFO'][7:])
+            if step:
+                start_response(
+                    self.code, [('Location', '/chain/%d' % (step - 1)),])
+                return []
         if environ['PATH_INFO'] == '/redirect.html':
             start_response(self.code, [('Location', self.url),])
             return []
@@ -131,6 +222,27 @@ class TestAppRedirect(object):
         return ['<html><p>It works!</p></html>']
 
 
+class TestAppLogin(object):
+    """A page redirecting to a login page, that sets a cookie and
+    redirects back.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, environ, start_response):
+        self.calls.append(environ['PATH_INFO'])
+        if environ['PATH_INFO'] == '/login.html':
+            start_response('302 Found', [('Location', '/page.html'),
+                                         ('Set-Cookie', 'session=42')])
+            return []
+        if 'session=42' not in environ.get('HTTP_COOKIE', ''):
+            start_response('302 Found', [('Location', '/login.html'),])
+            return []
+        start_response('200 Ok', [('Content-type', 'text/html'),])
+        return ['<html><p>Welcome!</p></html>']
+
+
 class TestAppTemplate(object):
 
     def __init__(self, filename, default_headers=None):
@@ -153,3 +265,142 @@ class TestAppTemplate(object):
             return [data.read()]
         start_response('404 Not Found', headers.items())
         return ['<html>File not found</html>']
+
+
+class TestAppSite(object):
+    """A small site to crawl.
+    """
+    pages = {
+        '/': ('<a href="/about.html">About</a>'
+              '<a href="section/index.html">Section</a>'
+              '<a href="/about.html#team">Team</a>'
+              '<a href="http://localhost/contact.html">Contact</a>'
+              '<a href="https://localhost/contact.html">Secure</a>'
+              '<a href="http://example.com/">External</a>'
+              '<a href="mailto:info@example.com">Mail</a>'),
+        '/about.html': '<a href="/">Home</a><a href="/missing.html">Gone</a>',
+        '/contact.html': ('<form action="/search.html" method="get">'
+                          '<input type="text" name="q" value="a&b" />'
+                          '</form>'
+                          '<form action="/send.html" method="post">'
+                          '<input type="text" name="message" />'
+                          '</form>'),
+        '/search.html': '<p>Results</p>',
+        '/section/index.html': '<a href="page.html">Page</a>',
+        '/section/page.html': '<a href="/old.html">Old</a>',
+        '/deep.html': '<p>Deep</p>',
+    }
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, environ, start_response):
+        path = environ['PATH_INFO']
+        query = environ['QUERY_STRING']
+        self.calls.append(path + ('?' + query if query else ''))
+        if path == '/old.html':
+            start_response('302 Found', [('Location', '/deep.html')])
+            return []
+        if path not in self.pages:
+            start_response('404 Not Found', [('Content-type', 'text/html')])
+            return ['<html><p>Not found</p></html>']
+        headers = [('Content-type', 'text/html')]
+        if path == '/':
+            headers.append(('Set-Cookie', 'visitor=crawler;Path=/'))
+        elif 'HTTP_COOKIE' not in environ:
+            start_response('403 Forbidden', headers)
+            return ['<html><p>No cookie</p></html>']
+        start_response('200 Ok', headers)
+        return ['<html><body>%s</body></html>' % self.pages[path]]
+
+
+class TestAppResources(object):
+    """Pages with images, scripts and stylesheets.
+    """
+    resources = {
+        '/index.html': (
+            'text/html',
+            '<html><head>'
+            '<link rel="stylesheet" href="/css/style.css" />'
+            '<link rel="icon" href="/favicon.ico" />'
+            '<script src="app.js"></script>'
+            '<style>body { background: url("/img/body.png"); }</style>'
+            '</head><body>'
+            '<img src="/img/logo.png" /><img src="img/logo.png#top" />'
+            '<img src="http://example.com/ad.png" />'
+            '<img src="data:image/png;base64,iVBORw0KGgo=" />'
+            '<div style="background: url(/img/missing.png)"></div>'
+            '</body></html>'),
+        '/other.html': (
+            'text/html',
+            '<html><head>'
+            '<link rel="stylesheet" href="/css/style.css" />'
+            '</head><body><img src="/img/logo.png" /></body></html>'),
+        '/css/style.css': (
+            'text/css',
+            '@import "print.css";\n'
+            'h1 { background: url(../img/title.png) }'),
+        '/css/print.css': ('text/css', 'h1 { color: black }'),
+        '/app.js': ('text/javascript', 'alert("hello");'),
+        '/img/body.png': ('image/png', 'body'),
+        '/img/logo.png': ('image/png', 'logo image'),
+        '/img/title.png': ('image/png', 'title'),
+    }
+
+    def __init__(self):
+        self.calls = []
+        self.concurrent = set()
+
+    def __call__(self, environ, start_response):
+        path = environ['PATH_INFO']
+        self.calls.append(path)
+        if environ['wsgi.multithread']:
+            self.concurrent.add(path)
+        if path not in self.resources:
+            start_response('404 Not Found', [('Content-type', 'text/html')])
+            return ['Not found']
+        content_type, data = self.resources[path]
+        start_response('200 Ok', [('Content-type', content_type)])
+        return [data]
+
+
+class TestAppSitemap(object):
+    """A sitemap of a configurable size, generated on the fly.
+    """
+
+    def __init__(self, urls=1000):
+        self.urls = urls
+        self.produced = 0
+
+    def __call__(self, environ, start_response):
+        self.produced = 0
+        start_response('200 Ok', [('Content-type', 'text/xml')])
+        yield ('<?xml version="1.0" encoding="UTF-8"?>'
+               '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+               '<meta><loc>/meta</loc></meta>')
+        for index in range(self.urls):
+            self.produced += 1
+            yield ('<url><loc>/page%d.html</loc>'
+                   '<priority>0.5</priority></url>' % index)
+        yield '</urlset>'
+
+
+class TestAppExport(object):
+    """A JSON export of a configurable size, generated on the fly.
+    """
+
+    def __init__(self, items=1000):
+        self.items = items
+        self.produced = 0
+
+    def __call__(self, environ, start_response):
+        self.produced = 0
+        start_response('200 Ok', [
+                ('Content-type', 'application/json; charset=utf-8')])
+        yield '{"meta": {"count": %d, "tags": ["a", "b"]},\n "items": [' % (
+            self.items)
+        for index in range(self.items):
+            self.produced += 1
+            yield '%s{"id": %d, "name": "Item \\u00e9 %d"}' % (
+                ', ' if index else '', index, index)
+        yield '], "next": null}'
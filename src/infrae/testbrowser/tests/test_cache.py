@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from infrae.testbrowser.browser import Browser
+from infrae.testbrowser.cache import HTTPCache
+from infrae.testbrowser.interfaces import IDocumentCache, IHTTPCache
+from infrae.testbrowser.tests import app
+
+from zope.interface.verify import verifyObject
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000000000.0
+
+    def __call__(self):
+        return self.now
+
+
+class HTTPCacheTestCase(unittest.TestCase):
+
+    def Browser(self, app):
+        browser = Browser(app)
+        browser.options.http_cache = True
+        self.clock = Clock()
+        browser.cache = HTTPCache(self.clock)
+        return browser
+
+    def test_disabled(self):
+        application = app.TestAppCache([('Cache-Control', 'max-age=60')])
+        with Browser(application) as browser:
+            self.assertTrue(verifyObject(IHTTPCache, browser.cache))
+            browser.open('/index.html')
+            browser.reload()
+            self.assertEqual(len(application.calls), 2)
+            self.assertEqual(len(browser.cache), 0)
+
+    def test_fresh(self):
+        application = app.TestAppCache([('Cache-Control', 'max-age=60')])
+        with self.Browser(application) as browser:
+            browser.open('/index.html')
+            browser.open('/other.html')
+            browser.open('/index.html')
+            self.assertEqual(browser.status_code, 200)
+            self.assertEqual(
+                browser.contents,
+                '<html><p>Language None, call 1</p></html>')
+            self.assertEqual(len(application.calls), 2)
+            self.assertEqual(browser.cache.hits, 1)
+            self.assertEqual(browser.cache.misses, 2)
+
+            # Once stale, the application is called again.
+            self.clock.now += 60
+            browser.reload()
+            self.assertEqual(
+                browser.contents,
+                '<html><p>Language None, call 3</p></html>')
+            self.assertEqual(browser.cache.misses, 3)
+
+    def test_not_cacheable(self):
+        application = app.TestAppCache([('Cache-Control', 'no-store')])
+        with self.Browser(application) as browser:
+            browser.open('/index.html')
+            browser.reload()
+            browser.open('/index.html', method='POST')
+            self.assertEqual(len(application.calls), 3)
+            self.assertEqual(len(browser.cache), 0)
+
+    def test_vary(self):
+        application = app.TestAppCache(
+            [('Cache-Control', 'max-age=60'), ('Vary', 'Accept-Language')])
+        with self.Browser(application) as browser:
+            browser.set_request_header('Accept-Language', 'en')
+            browser.open('/index.html')
+            browser.set_request_header('Accept-Language', 'fr')
+            browser.open('/index.html')
+            self.assertEqual(
+                browser.contents,
+                '<html><p>Language fr, call 2</p></html>')
+            browser.set_request_header('Accept-Language', 'en')
+            browser.open('/index.html')
+            self.assertEqual(
+                browser.contents,
+                '<html><p>Language en, call 1</p></html>')
+            self.assertEqual(len(browser.cache), 2)
+            self.assertEqual(browser.cache.hits, 1)
+
+    def test_revalidate(self):
+        application = app.TestAppCache(etag='"v1"')
+        with self.Browser(application) as browser:
+            browser.open('/index.html')
+            browser.reload()
+            self.assertEqual(browser.status_code, 200)
+            self.assertEqual(
+                browser.contents,
+                '<html><p>Language None, call 1</p></html>')
+            self.assertNotEqual(browser.html, None)
+            self.assertEqual(application.calls, [None, '"v1"'])
+            self.assertEqual(browser.cache.revalidations, 1)
+
+            # A new version is served in full.
+            application.etag = '"v2"'
+            browser.reload()
+            self.assertEqual(
+                browser.contents,
+                '<html><p>Language None, call 3</p></html>')
+            browser.reload()
+            self.assertEqual(application.calls, [None, '"v1"', '"v1"', '"v2"'])
+
+            browser.cache.clear()
+            self.assertEqual(len(browser.cache), 0)
+
+    def test_size(self):
+        application = app.TestAppCache([('Cache-Control', 'max-age=60')])
+        with self.Browser(application) as browser:
+            browser.options.http_cache_size = 2
+            browser.open('/a.html')
+            browser.open('/b.html')
+            browser.open('/a.html')
+            browser.open('/c.html')
+            self.assertEqual(len(browser.cache), 2)
+            self.assertEqual(len(application.calls), 3)
+
+            # The least recently used URL was discarded.
+            browser.open('/a.html')
+            browser.open('/b.html')
+            self.assertEqual(len(application.calls), 4)
+            self.assertEqual(browser.cache.hits, 2)
+
+    def test_server(self):
+        application = app.TestAppCache([('Cache-Control', 'max-age=60')])
+        with self.Browser(application) as browser:
+            browser.open('/index.html')
+            browser.options.server = 'example.com'
+            browser.open('/index.html')
+            browser.options.port = '8080'
+            browser.open('/index.html')
+            self.assertEqual(len(application.calls), 3)
+            self.assertEqual(len(browser.cache), 3)
+
+    def test_cookies(self):
+        """Cookies are not set again by stored responses.
+        """
+        application = app.TestAppCache(
+            [('Set-Cookie', 'session=42; path=/')], etag='"v1"')
+        with self.Browser(application) as browser:
+            browser.open('/index.html')
+            self.assertEqual(browser.cookies.keys(), ['session'])
+            browser.cookies.clear()
+            browser.reload()
+            self.assertEqual(browser.cache.revalidations, 1)
+            # The 304 response set the cookie again itself.
+            self.assertEqual(browser.cookies.keys(), ['session'])
+
+            application.headers = []
+            browser.cookies.clear()
+            browser.reload()
+            self.assertEqual(browser.cache.revalidations, 2)
+            self.assertEqual(browser.cookies.keys(), [])
+            self.assertEqual(browser.headers.get('Set-Cookie'), None)
+
+
+class DocumentCacheTestCase(unittest.TestCase):
+
+    def test_disabled(self):
+        with Browser(app.TestAppTemplate('default_form.html')) as browser:
+            self.assertTrue(verifyObject(IDocumentCache, browser.documents))
+            browser.open('/index.html')
+            browser.html
+            browser.reload()
+            browser.html
+            self.assertEqual(len(browser.documents), 0)
+            self.assertEqual(browser.documents.misses, 0)
+
+    def test_html(self):
+        with Browser(app.TestAppTemplate('default_form.html')) as browser:
+            browser.options.document_cache = 2
+            browser.open('/index.html')
+            form = browser.get_form('loginform')
+            form.get_control('login').value = 'ford'
+            form.html.getparent().remove(form.html)
+            self.assertEqual(browser.documents.misses, 1)
+            self.assertEqual(len(browser.documents), 1)
+
+            # Changes made to the document are not cached.
+            browser.reload()
+            form = browser.get_form('loginform')
+            self.assertEqual(browser.documents.hits, 1)
+            self.assertEqual(form.action, '/submit.html')
+            self.assertEqual(form.get_control('login').value, 'arthur')
+            self.assertEqual(form.submit(), 200)
+            self.assertEqual(
+                browser.html.xpath('//li/text()'), ['login: arthur'])
+
+            # The URL base is part of the key.
+            browser.open('/folder/index.html')
+            browser.html
+            self.assertEqual(browser.documents.misses, 3)
+            self.assertEqual(len(browser.documents), 2)
+
+    def test_json(self):
+        with Browser(app.test_app_json) as browser:
+            browser.options.document_cache = 1
+            browser.open('/data.json')
+            browser.json.append('changed')
+            browser.reload()
+            self.assertEqual(browser.json, [True, False, 1, u'a'])
+            # Decoding JSON is faster than copying it, it is not cached.
+            self.assertEqual(len(browser.documents), 0)
+            self.assertEqual(browser.documents.hits, 0)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from infrae.testbrowser.browser import Browser
+from infrae.testbrowser.cassette import Cassette
+from infrae.testbrowser.interfaces import ICassette
+from infrae.testbrowser.tests import app
+
+from zope.interface.verify import verifyObject
+
+
+class CassetteTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cassette.json.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def Browser(self, app, mode='auto', match=('method', 'uri')):
+        browser = Browser(app)
+        browser.options.cassette = self.path
+        browser.options.cassette_mode = mode
+        browser.options.cassette_match = match
+        return browser
+
+    def test_record_and_replay(self):
+        application = app.TestAppCount()
+        with self.Browser(application, 'record') as browser:
+            browser.open('/index.html')
+            browser.open('/edit.html')
+            browser.open('/index.html')
+            self.assertEqual(browser.contents,
+                             '<html><p>Call 2, path /index.html</p></html>')
+        self.assertEqual(application.counts,
+                         {'/index.html': 2, '/edit.html': 1})
+        self.assertTrue(os.path.exists(self.path))
+
+        application = app.TestAppCount()
+        with self.Browser(application, 'replay') as browser:
+            browser.open('/index.html')
+            self.assertEqual(browser.status, '200 Ok')
+            self.assertEqual(browser.content_type, 'text/html')
+            self.assertEqual(browser.html.xpath('//p/text()'),
+                             ['Call 1, path /index.html'])
+            browser.open('/index.html')
+            self.assertEqual(browser.contents,
+                             '<html><p>Call 2, path /index.html</p></html>')
+            # The last recorded response is replayed after.
+            browser.open('/index.html')
+            self.assertEqual(browser.contents,
+                             '<html><p>Call 2, path /index.html</p></html>')
+            self.assertRaises(AssertionError, browser.open, '/delete.html')
+        self.assertEqual(application.counts, {})
+
+    def test_auto(self):
+        with self.Browser(app.TestAppCount()) as browser:
+            browser.open('/index.html')
+
+        application = app.TestAppCount()
+        with self.Browser(application) as browser:
+            browser.open('/index.html')
+            browser.open('/edit.html')
+            browser.open('/edit.html')
+            self.assertEqual(application.counts, {'/edit.html': 1})
+            self.assertEqual(browser.contents,
+                             '<html><p>Call 1, path /edit.html</p></html>')
+        self.assertEqual(len(Cassette(self.path)), 2)
+
+    def test_record(self):
+        with self.Browser(app.TestAppCount()) as browser:
+            browser.open('/index.html')
+
+        # Recording starts a new cassette.
+        application = app.TestAppCount()
+        with self.Browser(application, 'record') as browser:
+            browser.open('/edit.html')
+            browser.open('/edit.html')
+            self.assertEqual(application.counts, {'/edit.html': 2})
+        cassette = Cassette(self.path)
+        self.assertTrue(verifyObject(ICassette, cassette))
+        self.assertEqual(len(cassette), 2)
+
+    def test_save(self):
+        """Interactions are written once the browser is closed, and
+        browsers sharing a cassette don't overwrite each other.
+        """
+        first = self.Browser(app.TestAppCount())
+        second = self.Browser(app.TestAppCount())
+        first.open('/index.html')
+        second.open('/edit.html')
+        self.assertFalse(os.path.exists(self.path))
+        first.close()
+        self.assertEqual(len(Cassette(self.path)), 1)
+        second.open('/delete.html')
+        second.close()
+        self.assertEqual(len(Cassette(self.path)), 3)
+
+        application = app.TestAppCount()
+        with self.Browser(application, 'replay') as browser:
+            for path in ['/index.html', '/edit.html', '/delete.html']:
+                browser.open(path)
+                self.assertEqual(
+                    browser.contents,
+                    '<html><p>Call 1, path %s</p></html>' % path)
+
+    def test_concurrent(self):
+        paths = map(lambda index: '/page%d.html' % index, range(20))
+        with self.Browser(app.TestAppCount(), 'record') as browser:
+            browser.open_many(paths, concurrency=4)
+        cassette = Cassette(self.path)
+        self.assertEqual(len(cassette), 20)
+        with self.Browser(app.TestAppCount(), 'replay') as browser:
+            results = browser.open_many(paths)
+            self.assertEqual(
+                map(lambda r: r.contents, results),
+                map(lambda path: '<html><p>Call 1, path %s</p></html>' % path,
+                    paths))
+
+    def test_match(self):
+        with self.Browser(app.test_app_data, match=('method', 'uri', 'body')
+                          ) as browser:
+            browser.open('/', method='POST', data='first',
+                         data_type='text/plain')
+            browser.open('/', method='POST', data='second',
+                         data_type='text/plain')
+
+        with self.Browser(app.test_app_data, 'replay',
+                          ('method', 'uri', 'body')) as browser:
+            browser.open('/', method='POST', data='second',
+                         data_type='text/plain')
+            self.assertEqual(
+                browser.html.xpath('//li/text()'),
+                ['content type:text/plain', 'content length:6', 'second'])
+
+    def test_invalid(self):
+        self.assertRaises(AssertionError, Cassette, self.path, 'play')
+        self.assertRaises(AssertionError, Cassette, self.path, 'auto',
+                          ('method', 'cookies'))
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from infrae.testbrowser.browser import Browser
+from infrae.testbrowser.crawl import Crawler, crawl, find_urls
+from infrae.testbrowser.tests import app
+
+
+class CrawlTestCase(unittest.TestCase):
+
+    def test_crawl(self):
+        application = app.TestAppSite()
+        report = crawl(application)
+        self.assertEqual(
+            sorted(report.urls),
+            ['/', '/about.html', '/contact.html', '/missing.html',
+             '/old.html', '/search.html?q=a%26b', '/section/index.html',
+             '/section/page.html'])
+        self.assertEqual(report.urls[0], '/')
+        self.assertEqual(len(report), 8)
+        # Each page is requested once, following redirects.
+        self.assertEqual(
+            sorted(application.calls),
+            ['/', '/about.html', '/contact.html', '/deep.html',
+             '/missing.html', '/old.html', '/search.html?q=a%26b',
+             '/section/index.html', '/section/page.html'])
+
+        pages = dict(map(lambda p: (p.url, p), report))
+        self.assertEqual(pages['/'].depth, 0)
+        self.assertEqual(pages['/'].referrer, None)
+        self.assertEqual(pages['/section/page.html'].depth, 2)
+        self.assertEqual(pages['/section/page.html'].referrer,
+                         '/section/index.html')
+        self.assertEqual(pages['/old.html'].status_code, 200)
+        self.assertEqual(pages['/about.html'].size, 78)
+
+        # All the browsers shared the cookie set by the first page.
+        self.assertEqual(report.errors, [pages['/missing.html']])
+        self.assertEqual(pages['/missing.html'].status_code, 404)
+        self.assertRaises(AssertionError, report.check)
+        self.assertEqual(len(report.slowest(3)), 3)
+        self.assertEqual(len(report.format().splitlines()), 8)
+
+    def test_budget(self):
+        with Crawler(app.TestAppSite(), size=2, max_depth=1) as crawler:
+            report = crawler.crawl('/')
+            self.assertEqual(
+                sorted(report.urls),
+                ['/', '/about.html', '/contact.html',
+                 '/section/index.html'])
+            self.assertEqual(crawler.cookies, ['visitor'])
+
+        report = crawl(app.TestAppSite(), max_pages=3)
+        self.assertEqual(len(report), 3)
+        self.assertEqual(report.urls[0], '/')
+
+    def test_https(self):
+        """Absolute links are followed on the default port of their
+        scheme.
+        """
+
+        def setup(browser):
+            browser.options.port = '443'
+
+        report = crawl(app.TestAppSite(), setup=setup)
+        self.assertEqual(
+            sorted(report.urls),
+            ['/', '/about.html', '/contact.html', '/missing.html',
+             '/old.html', '/search.html?q=a%26b', '/section/index.html',
+             '/section/page.html'])
+
+    def test_find_urls(self):
+        """GET forms are followed with the URL a submit would use.
+        """
+        calls = []
+
+        def application(environ, start_response):
+            calls.append(environ['PATH_INFO'] + '?' + environ['QUERY_STRING'])
+            start_response('200 Ok', [('Content-type', 'text/html')])
+            return ['<html><body>'
+                    '<form name="search" method="get"'
+                    ' action="/search.html?lang=en">'
+                    '<input type="text" name="q" value="ok" /></form>'
+                    '<form name="list" method="get"'
+                    ' action="/list.html?page=2"></form>'
+                    '</body></html>']
+
+        with Browser(application) as browser:
+            browser.open('/index.html')
+            urls = find_urls(browser)
+            self.assertEqual(urls, ['/search.html?q=ok', '/list.html?page=2'])
+            for name in ('search', 'list'):
+                browser.open('/index.html')
+                browser.get_form(name).submit()
+        self.assertEqual(
+            calls[2::2], ['/search.html?q=ok', '/list.html?page=2'])
+
+    def test_errors(self):
+
+        def broken(environ, start_response):
+            raise ValueError('broken')
+
+        report = crawl(broken, '/index.html', size=1)
+        self.assertEqual(report.urls, ['/index.html'])
+        self.assertEqual(report.pages[0].status_code, None)
+        self.assertIn('ValueError: broken', report.pages[0].error)
+        self.assertEqual(len(report.errors), 1)
@@ -4,7 +4,7 @@
 
 import unittest
 
-from infrae.testbrowser.headers import HTTPHeaders
+from infrae.testbrowser.headers import HTTPHeaders, format_cgi_header
 
 class HeaderTestCase(unittest.TestCase):
 
@@ -66,3 +66,13 @@ class HeaderTestCase(unittest.TestCase):
             list(headers.iteritems()),
             [('Content-Length', '42'), ('Content-Type', 'text/plain')])
 
+    def test_format_cgi_header(self):
+        """Header names can be converted to CGI environment keys.
+        """
+        self.assertEquals(format_cgi_header('Accept'), 'HTTP_ACCEPT')
+        self.assertEquals(
+            format_cgi_header('If-Modified-Since'),
+            'HTTP_IF_MODIFIED_SINCE')
+        self.assertEquals(
+            format_cgi_header('If-Modified-Since'),
+            'HTTP_IF_MODIFIED_SINCE')
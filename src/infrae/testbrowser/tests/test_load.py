@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from infrae.testbrowser.load import Latencies, LoadTest
+from infrae.testbrowser.tests import app
+
+
+class LatenciesTestCase(unittest.TestCase):
+
+    def test_percentiles(self):
+        latencies = Latencies(map(float, range(100, 0, -1)))
+        self.assertEqual(latencies.count, 100)
+        self.assertEqual(latencies.mean, 50.5)
+        self.assertEqual(latencies.max, 100.0)
+        self.assertEqual(latencies.p50, 50.0)
+        self.assertEqual(latencies.p95, 95.0)
+        self.assertEqual(latencies.p99, 99.0)
+        self.assertEqual(Latencies([]).p99, 0.0)
+
+
+class LoadTestCase(unittest.TestCase):
+
+    def test_iterations(self):
+        def scenario(browser):
+            browser.open('/redirect.html')
+            browser.open('/page.html?id=42')
+
+        test = LoadTest(
+            app.TestAppRedirect('302 Found'), scenario, users=3,
+            patterns=[('page', r'^/page\.html')])
+        report = test.run(iterations=10)
+        self.assertEqual(report.errors, [])
+        self.assertEqual(report.requests, 30)
+        self.assertTrue(report.requests_per_second > 0)
+        self.assertEqual(report.latencies.count, 30)
+        self.assertEqual(
+            dict(map(lambda (k, v): (k, v.count), report.by_url.items())),
+            {'/redirect.html': 10, '/target.html': 10, 'page': 10})
+        self.assertEqual(
+            dict(map(lambda (k, v): (k, v.count), report.by_status.items())),
+            {200: 20, 302: 10})
+        self.assertIn('30 requests', report.format())
+
+    def test_duration(self):
+        def scenario(browser):
+            browser.open('/index.html')
+            assert browser.status_code == 200
+
+        report = LoadTest(app.test_app_iter, scenario, users=2).run(
+            duration=0.1)
+        self.assertEqual(report.errors, [])
+        self.assertTrue(report.requests > 0)
+        self.assertEqual(report.by_status.keys(), [200])
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from infrae.testbrowser.browser import Browser
+from infrae.testbrowser.interfaces import IMemoryTracer
+from infrae.testbrowser.memory import source_file, tracemalloc
+from infrae.testbrowser.tests import app
+
+from zope.interface.verify import verifyObject
+
+
+class TestAppAllocate(object):
+
+    def __init__(self):
+        self.kept = []
+
+    def __call__(self, environ, start_response):
+        self.kept.append(['x' * 64 for index in range(1000)])
+        start_response('200 Ok', [('Content-type', 'text/html'),])
+        return ['<html><form name="edit"><input name="title" /></form></html>']
+
+
+class MemoryTestCase(unittest.TestCase):
+
+    def test_disabled(self):
+        with Browser(app.test_app_iter) as browser:
+            self.assertTrue(verifyObject(IMemoryTracer, browser.memory))
+            browser.open('/index.html')
+            self.assertEqual(browser.memory.report(), {})
+
+    def test_report(self):
+        with Browser(TestAppAllocate()) as browser:
+            browser.options.trace_memory = True
+            browser.open('/index.html')
+            browser.get_form('edit')
+            browser.open('/edit.html')
+
+        report = browser.memory.report(limit=5)
+        self.assertEqual(sorted(report.keys()), ['/edit.html', '/index.html'])
+        self.assertEqual(
+            sorted(report['/index.html'].keys()),
+            ['application', 'browser'])
+        site, size = report['/index.html']['application'][0]
+        if tracemalloc is not None:
+            self.assertIn('test_memory.py', site)
+            self.assertTrue(size > 64 * 1000)
+        else:
+            # Without tracemalloc, objects are reported by type.
+            self.assertEqual(site, 'list')
+            self.assertTrue(size > 8 * 1000)
+            # The objects of the application are not reported twice.
+            self.assertTrue(
+                dict(report['/index.html']['browser']).get('list', 0) <
+                8 * 1000)
+        self.assertTrue(len(report['/index.html']['browser']) <= 5)
+        self.assertIn('/index.html', browser.memory.format())
+
+        browser.memory.clear()
+        self.assertEqual(browser.memory.report(), {})
+
+    def test_source_file(self):
+        self.assertEqual(source_file('/src/memory.pyc'), '/src/memory.py')
+        self.assertEqual(source_file('/src/memory.pyo'), '/src/memory.py')
+        self.assertEqual(source_file('/src/memory.py'), '/src/memory.py')
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from infrae.testbrowser.pool import BrowserPool, ProcessPool
+from infrae.testbrowser.tests import app
+
+
+def unreadable():
+    raise ValueError(u'Truncated result')
+
+
+class Unreadable(object):
+
+    def __reduce__(self):
+        return (unreadable, ())
+
+
+class BrowserPoolTestCase(unittest.TestCase):
+
+    def test_run(self):
+        def scenario(browser):
+            assert browser.open('/index.html') == 200
+            return browser.html.xpath(
+                '//li[contains(text(), "multithread")]/text()')
+
+        with BrowserPool(app.test_app_environ, size=3) as pool:
+            results = pool.run(scenario, iterations=7)
+            results.check()
+            self.assertEqual(len(results), 7)
+            self.assertEqual(
+                map(lambda r: r.iteration, results),
+                range(7))
+            self.assertEqual(
+                results.values,
+                [['wsgi.multithread: True']] * 7)
+            self.assertEqual(results.errors, [])
+            self.assertTrue(results.throughput > 0)
+
+    def test_cookies(self):
+        """Each browser of the pool has its own cookies.
+        """
+        def setup(browser):
+            browser.open('/login.html')
+
+        def scenario(browser):
+            browser.reload()
+            return browser.html.xpath('//ul/li/text()')
+
+        with BrowserPool(
+            app.test_app_cookies_server, size=2, setup=setup) as pool:
+            for browser in pool.browsers:
+                self.assertEqual(browser.cookies, ['browser'])
+            pool.browsers[0].cookies.clear()
+            self.assertEqual(pool.browsers[1].cookies, ['browser'])
+            results = pool.run(scenario, iterations=4)
+            # Only the first run of the first browser is without cookies.
+            first = filter(lambda r: r.worker == 0, results)[:1]
+            others = filter(lambda r: r not in first, results)
+            self.assertEqual(
+                map(lambda r: r.value, first),
+                [[]] * len(first))
+            self.assertEqual(
+                map(lambda r: r.value, others),
+                [['browser=testing']] * len(others))
+
+    def test_errors(self):
+        def scenario(browser):
+            browser.open('/index.html')
+            assert browser.status_code == 404, u'Page is not missing'
+
+        with BrowserPool(app.test_app_iter, size=2) as pool:
+            results = pool.run(scenario, iterations=3)
+            self.assertEqual(results.values, [])
+            self.assertEqual(len(results.errors), 3)
+            self.assertIn(u'Page is not missing', results.errors[0].error)
+            self.assertRaises(AssertionError, results.check)
+
+
+class ProcessPoolTestCase(unittest.TestCase):
+
+    def test_run(self):
+        def scenario(browser):
+            assert browser.open('/index.html') == 200
+            return browser.html.xpath(
+                '//li[contains(text(), "multiprocess")]/text()')
+
+        pool = ProcessPool(app.test_app_environ, size=3)
+        results = pool.run(scenario, iterations=7)
+        results.check()
+        self.assertEqual(
+            map(lambda r: r.iteration, results),
+            range(7))
+        self.assertEqual(
+            sorted(set(map(lambda r: r.worker, results))),
+            [0, 1, 2])
+        self.assertEqual(
+            results.values,
+            [['wsgi.multiprocess: True']] * 7)
+
+    def test_forked_application(self):
+        """The application is shared by copy between the processes.
+        """
+        application = app.TestAppCount()
+
+        def scenario(browser):
+            browser.open('/index.html')
+            return browser.contents
+
+        results = ProcessPool(application, size=2).run(
+            scenario, iterations=4)
+        self.assertEqual(
+            results.values,
+            ['<html><p>Call 1, path /index.html</p></html>',
+             '<html><p>Call 1, path /index.html</p></html>',
+             '<html><p>Call 2, path /index.html</p></html>',
+             '<html><p>Call 2, path /index.html</p></html>'])
+        self.assertEqual(application.counts, {})
+
+    def test_errors(self):
+        def scenario(browser):
+            browser.open('/index.html')
+            assert browser.status_code == 404, u'Page is not missing'
+
+        results = ProcessPool(app.test_app_iter, size=2).run(scenario)
+        self.assertEqual(len(results.errors), 2)
+        self.assertIn(u'Page is not missing', results.errors[0].error)
+
+        # Values that cannot be sent back are represented.
+        results = ProcessPool(app.test_app_iter, size=2).run(
+            lambda browser: lambda: None)
+        results.check()
+        self.assertEqual(len(results.values), 2)
+        self.assertTrue(results.values[0].startswith('<function'))
+
+        # Results that cannot be read are reported as failures.
+        results = ProcessPool(app.test_app_iter, size=2).run(
+            lambda browser: Unreadable(), iterations=4)
+        self.assertEqual(len(results.errors), 4)
+        self.assertEqual(
+            map(lambda r: r.iteration, results.errors), range(4))
+        self.assertIn(u'status 0', results.errors[0].error)
+        self.assertIn(u'Truncated result', results.errors[0].error)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from infrae.testbrowser.browser import Browser
+from infrae.testbrowser.interfaces import IProfiles
+from infrae.testbrowser.tests import app
+
+from zope.interface.verify import verifyObject
+
+
+class ProfilingTestCase(unittest.TestCase):
+
+    def test_disabled(self):
+        with Browser(app.test_app_iter) as browser:
+            self.assertTrue(verifyObject(IProfiles, browser.profiles))
+            browser.open('/index.html')
+            self.assertEqual(browser.profiles.keys(), [])
+
+    def test_profile(self):
+        def calls(stats):
+            for (filename, line, name), data in stats.stats.items():
+                if name == 'test_app_iter':
+                    return data[1]
+            return 0
+
+        with Browser(app.test_app_iter) as browser:
+            browser.options.profile = True
+            browser.open('/index.html')
+            browser.open('/edit.html?id=42')
+            browser.reload()
+            self.assertEqual(
+                browser.profiles.keys(),
+                ['/edit.html', '/index.html'])
+            # Calls are accumulated by path.
+            self.assertEqual(calls(browser.profiles['/index.html']), 1)
+            self.assertEqual(calls(browser.profiles['/edit.html']), 2)
+
+            directory = tempfile.mkdtemp()
+            try:
+                filenames = browser.profiles.dump(directory)
+                self.assertEqual(
+                    sorted(map(os.path.basename, filenames)),
+                    ['edit.html.prof', 'index.html.prof'])
+            finally:
+                shutil.rmtree(directory)
+
+            browser.profiles.clear()
+            self.assertEqual(len(browser.profiles), 0)
+
+    def test_pattern(self):
+        with Browser(app.test_app_iter) as browser:
+            browser.options.profile = r'^/edit'
+            browser.open('/index.html')
+            browser.open('/edit.html')
+            self.assertEqual(browser.profiles.keys(), ['/edit.html'])
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from infrae.testbrowser.browser import Browser
+from infrae.testbrowser.interfaces import IStatistics
+from infrae.testbrowser.stats import Statistics, registry
+from infrae.testbrowser.tests import app
+
+from zope.interface.verify import verifyObject
+
+
+class StatisticsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_statistics(self):
+        parent = Statistics()
+        statistics = Statistics(parent)
+        self.assertTrue(verifyObject(IStatistics, statistics))
+        statistics.increment('requests', method='GET', status=200)
+        statistics.increment('requests', method='GET', status=200)
+        statistics.increment('requests', method='POST', status=302)
+        statistics.increment('received_bytes', 42)
+        statistics.observe('parse_seconds', 0.002, format='html')
+        statistics.observe('parse_seconds', 42.0, format='html')
+        self.assertEqual(statistics.get('requests', method='GET', status=200), 2)
+        self.assertEqual(statistics.get('requests', method='PUT', status=200), 0)
+        self.assertEqual(statistics.get('parse_seconds', format='html'), 2)
+        self.assertEqual(statistics.total('requests'), 3)
+
+        # Values are added to the parent as well.
+        Statistics(parent).increment('received_bytes', 8)
+        self.assertEqual(parent.total('requests'), 3)
+        self.assertEqual(parent.get('received_bytes'), 50)
+
+        lines = statistics.format().splitlines()
+        self.assertEqual(
+            lines[:5],
+            ['# TYPE testbrowser_received_bytes counter',
+             'testbrowser_received_bytes 42',
+             '# TYPE testbrowser_requests counter',
+             'testbrowser_requests{method="GET",status="200"} 2',
+             'testbrowser_requests{method="POST",status="302"} 1'])
+        self.assertEqual(lines[5], '# TYPE testbrowser_parse_seconds histogram')
+        self.assertEqual(
+            lines[6:8],
+            ['testbrowser_parse_seconds_bucket{format="html",le="0.001"} 0',
+             'testbrowser_parse_seconds_bucket{format="html",le="0.005"} 1'])
+        self.assertEqual(
+            lines[-3:],
+            ['testbrowser_parse_seconds_bucket{format="html",le="+Inf"} 2',
+             'testbrowser_parse_seconds_sum{format="html"} 42.002',
+             'testbrowser_parse_seconds_count{format="html"} 2'])
+
+        filename = os.path.join(self.directory, 'statistics.json')
+        statistics.write(filename, 'json')
+        with open(filename, 'rb') as data:
+            result = json.load(data)
+        self.assertEqual(
+            result['counters']['requests'],
+            [{'labels': {'method': 'GET', 'status': 200}, 'value': 2},
+             {'labels': {'method': 'POST', 'status': 302}, 'value': 1}])
+        histogram = result['histograms']['parse_seconds'][0]
+        self.assertEqual(histogram['labels'], {'format': 'html'})
+        self.assertEqual(histogram['count'], 2)
+        self.assertEqual(histogram['buckets'][:2], [[0.001, 0], [0.005, 1]])
+
+        self.assertRaises(
+            AssertionError, statistics.write, filename, 'csv')
+        statistics.clear()
+        self.assertEqual(statistics.format(), '\n')
+        self.assertEqual(parent.total('requests'), 3)
+
+    def test_browser(self):
+        requests = registry.total('requests')
+        with Browser(app.TestAppTemplate('simple_form.html')) as browser:
+            self.assertTrue(verifyObject(IStatistics, browser.statistics))
+            browser.options.statistics = True
+            browser.options.statistics_registry = True
+            browser.open('/index.html')
+            self.assertNotEqual(browser.html, None)
+            received = browser.wire_size
+            form = browser.get_form('loginform')
+            self.assertEqual(form.get_control('save').submit(), 200)
+            statistics = browser.statistics
+            self.assertEqual(
+                statistics.get('requests', method='GET', status=200), 1)
+            self.assertEqual(
+                statistics.get('requests', method='POST', status=200), 1)
+            self.assertEqual(
+                statistics.get('form_submissions', method='POST'), 1)
+            self.assertEqual(
+                statistics.get('sent_bytes'),
+                len('login=arthur&password=&save=Save'))
+            self.assertEqual(
+                statistics.get('received_bytes'),
+                received + browser.wire_size)
+            self.assertEqual(statistics.get('parse_seconds', format='html'), 1)
+            self.assertEqual(statistics.get('request_seconds', method='GET'), 1)
+        # The browsers are aggregated in the registry.
+        self.assertEqual(registry.total('requests'), requests + 2)
+
+        # Unless they are not attached to it.
+        with Browser(app.TestAppTemplate('simple_form.html')) as browser:
+            browser.options.statistics = True
+            browser.options.statistics_registry = False
+            browser.open('/index.html')
+            self.assertEqual(browser.statistics.total('requests'), 1)
+            self.assertEqual(browser.statistics.parent, None)
+        self.assertEqual(registry.total('requests'), requests + 2)
+
+    def test_disabled(self):
+        with Browser(app.TestAppTemplate('simple_form.html')) as browser:
+            browser.options.statistics_registry = False
+            browser.open('/index.html')
+            self.assertNotEqual(browser.html, None)
+            self.assertEqual(browser.statistics.as_dict(),
+                             {'counters': {}, 'histograms': {}})
+
+    def test_redirects(self):
+        with Browser(app.TestAppRedirect('302 Found')) as browser:
+            browser.options.statistics = True
+            self.assertEqual(browser.open('/chain/3'), 200)
+            self.assertEqual(browser.statistics.get('redirects'), 3)
+            self.assertEqual(
+                browser.statistics.get('requests', method='GET', status=302),
+                3)
+
+    def test_cache_hits(self):
+        application = app.TestAppCache([('Cache-Control', 'max-age=60')])
+        with Browser(application) as browser:
+            browser.options.statistics = True
+            browser.options.http_cache = True
+            browser.options.document_cache = 1
+            browser.open('/index.html')
+            browser.html
+            browser.open('/index.html')
+            browser.html
+            statistics = browser.statistics
+            self.assertEqual(statistics.get('cache_hits', cache='http'), 1)
+            self.assertEqual(statistics.get('cache_hits', cache='document'), 1)
+            # Only the first response was transferred.
+            self.assertEqual(statistics.get('received_bytes'), 41)
+            self.assertEqual(
+                statistics.get('requests', method='GET', status=200), 2)
+
+    def test_revalidation(self):
+        application = app.TestAppCache(etag='"v1"')
+        with Browser(application) as browser:
+            browser.options.statistics = True
+            browser.options.http_cache = True
+            browser.open('/index.html')
+            browser.reload()
+            self.assertEqual(browser.status_code, 200)
+            self.assertEqual(browser.cache.revalidations, 1)
+            # The status answered by the application is counted.
+            statistics = browser.statistics
+            self.assertEqual(
+                statistics.get('requests', method='GET', status=200), 1)
+            self.assertEqual(
+                statistics.get('requests', method='GET', status=304), 1)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import io
+import unittest
+
+from infrae.testbrowser.browser import Browser
+from infrae.testbrowser.streaming import JSONReader, iter_json, iter_xml
+from infrae.testbrowser.tests import app
+
+
+class XMLTestCase(unittest.TestCase):
+
+    def test_filters(self):
+        data = ('<feed><title>Feed</title>'
+                '<entry><title>First</title></entry>'
+                '<group><entry><title>Second</title></entry></group>'
+                '</feed>')
+
+        def titles(**filters):
+            return map(lambda e: e.findtext('title') or e.text,
+                       iter_xml(io.BytesIO(data), **filters))
+
+        self.assertEqual(titles(tag='entry'), ['First', 'Second'])
+        self.assertEqual(titles(path='feed/entry'), ['First'])
+        self.assertEqual(titles(path='/feed/group/entry'), ['Second'])
+        self.assertEqual(titles(path='feed/*/entry'), ['Second'])
+        self.assertEqual(titles(tag='title', path='feed/title'), ['Feed'])
+        self.assertEqual(titles(tag='missing'), [])
+
+    def test_browser(self):
+        application = app.TestAppSitemap(urls=1000)
+        with Browser(application) as browser:
+            browser.open('/sitemap.xml', stream=True)
+            self.assertEqual(application.produced, 0)
+            count = 0
+            for url in browser.iter_xml(path='urlset/url'):
+                self.assertEqual(
+                    url.findtext('{*}loc'), '/page%d.html' % count)
+                # Processed elements are removed from the document.
+                self.assertTrue(url.getparent().index(url) <= 1)
+                if not count:
+                    # The payload is parsed as it is read.
+                    self.assertTrue(application.produced < 1000)
+                count += 1
+            self.assertEqual(count, 1000)
+
+            # Namespaced tags can be used as well, without streaming.
+            browser.open('/sitemap.xml')
+            self.assertEqual(
+                len(list(browser.iter_xml(
+                            '{http://www.sitemaps.org/schemas/sitemap/0.9}loc'))),
+                1001)
+
+        with Browser(app.test_app_text) as browser:
+            browser.open('/index.txt')
+            self.assertRaises(AssertionError, browser.iter_xml, 'url')
+
+
+class JSONTestCase(unittest.TestCase):
+
+    def values(self, data, path=None, chunk_size=3):
+        reader = JSONReader(io.BytesIO(data), chunk_size=chunk_size)
+        return list(reader.select(path.split('.') if path else []))
+
+    def test_paths(self):
+        data = ('{"meta": {"count": 12345, "tags": ["a", "b"]}, '
+                '"items": [{"id": 1.5e3}, {"id": true, "x": "\\u00e9"}], '
+                '"empty": [], "next": null}')
+        self.assertEqual(self.values(data, 'meta.count'), [12345])
+        self.assertEqual(self.values(data, 'meta.tags.*'), [u'a', u'b'])
+        self.assertEqual(self.values(data, 'meta.tags.1'), [u'b'])
+        self.assertEqual(self.values(data, 'items.*.id'), [1500.0, True])
+        self.assertEqual(self.values(data, 'items.1.x'), [u'\xe9'])
+        self.assertEqual(self.values(data, 'empty.*'), [])
+        self.assertEqual(self.values(data, 'next'), [None])
+        self.assertEqual(self.values(data, 'next.*'), [])
+        self.assertEqual(self.values(data, 'missing'), [])
+        self.assertEqual(len(self.values(data, '*')), 4)
+        self.assertEqual(self.values(data)[0]['meta']['count'], 12345)
+        self.assertEqual(self.values(' [1, 22 ,333] ', '*', 1), [1, 22, 333])
+        self.assertEqual(
+            list(iter_json(io.BytesIO('[1, 2]'), '*')), [1, 2])
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, self.values, '[1, 2', '*')
+        self.assertRaises(ValueError, self.values, '[1 2]', '*')
+        self.assertRaises(ValueError, self.values, '{"a" 1}', 'a')
+
+    def test_browser(self):
+        application = app.TestAppExport(items=5000)
+        with Browser(application) as browser:
+            browser.open('/export.json', stream=True)
+            count = 0
+            for item in browser.iter_json('items.*'):
+                self.assertEqual(item, {'id': count,
+                                        'name': u'Item \xe9 %d' % count})
+                if not count:
+                    # The payload is decoded as it is read.
+                    self.assertTrue(application.produced < 5000)
+                count += 1
+            self.assertEqual(count, 5000)
+
+            browser.open('/export.json')
+            self.assertEqual(list(browser.iter_json('meta.count')), [5000])
+            self.assertEqual(len(browser.json['items']), 5000)
+            self.assertEqual(browser.json['items'][1]['name'],
+                             u'Item \xe9 1')
+
+        with Browser(app.test_app_text) as browser:
+            browser.open('/index.txt')
+            self.assertRaises(AssertionError, browser.iter_json, 'items')
@@ -4,7 +4,9 @@
 
 import unittest
 
+from infrae.testbrowser.browser import Options
 from infrae.testbrowser.form import parse_charset
+from infrae.testbrowser.utils import Handlers, canonical_url
 
 
 class UtilsTestCase(unittest.TestCase):
@@ -20,3 +22,87 @@ class UtilsTestCase(unittest.TestCase):
             parse_charset('invalid ,, invalid utf8'),
             ['utf-8'])
 
+    def test_canonical_url(self):
+        options = Options()
+        self.assertEqual(
+            canonical_url('/index.html?a=1#top', options), '/index.html?a=1')
+        self.assertEqual(canonical_url('http://localhost', options), '/')
+        self.assertEqual(
+            canonical_url('http://LocalHost:80/index.html', options),
+            '/index.html')
+        self.assertEqual(
+            canonical_url('//localhost/index.html', options), '/index.html')
+        self.assertEqual(
+            canonical_url('https://localhost/index.html', options), None)
+        self.assertEqual(
+            canonical_url('http://localhost:8080/index.html', options), None)
+        self.assertEqual(
+            canonical_url('http://example.com/index.html', options), None)
+        self.assertEqual(canonical_url('mailto:info@localhost', options), None)
+
+        # The default port depends on the scheme.
+        options.port = '443'
+        self.assertEqual(
+            canonical_url('https://localhost/index.html', options),
+            '/index.html')
+        self.assertEqual(
+            canonical_url('https://localhost:443/index.html', options),
+            '/index.html')
+        self.assertEqual(
+            canonical_url('//localhost/index.html', options), '/index.html')
+        self.assertEqual(
+            canonical_url('http://localhost/index.html', options), None)
+        self.assertEqual(
+            canonical_url('http://localhost:443/index.html', options),
+            '/index.html')
+
+    def test_handlers(self):
+        called = []
+        handlers = Handlers()
+        first = lambda value: called.append(('first', value))
+        second = lambda value: value * 2 if value else None
+        third = lambda value: called.append(('third', value))
+        handlers.add('query', first, unique=True)
+        self.assertIs(handlers.query, first)
+        handlers.add('query', second, unique=True)
+        handlers.add('query', third, unique=True)
+
+        # Handlers are chained once, when they are added.
+        chain = handlers.query
+        self.assertIs(handlers.query, chain)
+        self.assertIs(handlers['query'], chain)
+
+        # All the handlers are called.
+        self.assertEqual(chain(21), None)
+        self.assertEqual(
+            called, [('first', 21), ('third', 21)])
+
+        # The request, response and redirect handlers stop on the
+        # first one returning a value.
+        del called[:]
+        handlers.add('request', first, unique=True)
+        handlers.add('request', second, unique=True)
+        handlers.add('request', third, unique=True)
+        self.assertEqual(handlers.request(21), 42)
+        self.assertEqual(handlers.request(0), None)
+        self.assertEqual(
+            called, [('first', 21), ('first', 0), ('third', 0)])
+        handlers.remove('request')
+
+        copy = handlers.copy()
+        handlers.remove('query', first)
+        handlers.remove('query', third)
+        self.assertIs(handlers.query, second)
+        self.assertEqual(copy.query(1), None)
+        handlers.remove('query', lambda value: value)
+        self.assertIn('query', handlers)
+        handlers.remove('query')
+        self.assertNotIn('query', handlers)
+        self.assertEqual(handlers.get('query'), None)
+        self.assertRaises(AttributeError, getattr, handlers, 'query')
+
+        handlers.add('close', first)
+        handlers.remove('close', second)
+        self.assertIs(handlers.close, first)
+        handlers.remove('close', first)
+        self.assertNotIn('close', handlers)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2010-2013 Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from infrae.testbrowser.browser import Options
+from infrae.testbrowser.tests import app
+from infrae.testbrowser.wsgi import WSGIOutput, WSGIServer
+
+
+class OutputTestCase(unittest.TestCase):
+
+    def test_memory(self):
+        """Without threshold, the payload stays in memory.
+        """
+        output = WSGIOutput()
+        output.write('Hello ')
+        output.write('world!')
+        self.assertEqual(output.spilled, False)
+        self.assertEqual(output.size, 12)
+        self.assertEqual(output.getvalue(), 'Hello world!')
+
+    def test_spill(self):
+        """Once the threshold is reached, the payload is moved to a
+        file.
+        """
+        output = WSGIOutput(8)
+        output.write('Hello ')
+        self.assertEqual(output.spilled, False)
+        output.write('world!')
+        self.assertEqual(output.spilled, True)
+        self.assertEqual(output.size, 12)
+        self.assertEqual(output.getvalue(), 'Hello world!')
+        output.seek(0)
+        self.assertEqual(output.read(5), 'Hello')
+        output.close()
+
+
+class ServerTestCase(unittest.TestCase):
+
+    def test_environ_template(self):
+        """The part of the environment computed from the options is
+        only computed again when they change.
+        """
+        options = Options()
+        options.default_wsgi_environ = {'REMOTE_USER': 'admin'}
+        server = WSGIServer(app.test_app_environ, options)
+        template = server.get_environ_template()
+        self.assertIs(server.get_environ_template(), template)
+        self.assertEqual(template['REMOTE_USER'], 'admin')
+
+        environ = server.get_environ(
+            'POST', '/edit?id=42', [('X-Requested-With', 'test')],
+            'data', 'text/plain')
+        self.assertEqual(environ['PATH_INFO'], '/edit')
+        self.assertEqual(environ['QUERY_STRING'], 'id=42')
+        self.assertEqual(environ['HTTP_X_REQUESTED_WITH'], 'test')
+        self.assertEqual(environ['wsgi.input'].read(), 'data')
+        self.assertNotIn('PATH_INFO', template)
+
+        options.default_wsgi_environ['REMOTE_USER'] = 'editor'
+        template = server.get_environ_template()
+        self.assertEqual(template['REMOTE_USER'], 'editor')
+
+        options.port = '443'
+        template = server.get_environ_template()
+        self.assertEqual(template['wsgi.url_scheme'], 'https')
+        self.assertEqual(template['HTTPS'], 'on')
+
+    def test_close(self):
+        """Closing a response releases the application, but not the
+        payload.
+        """
+        options = Options()
+        options.spill_threshold = 32
+        server = WSGIServer(app.test_app_iter, options)
+        response = server('GET', '/index.html', [])
+        self.assertEqual(response.output.spilled, True)
+        response.close()
+        self.assertEqual(response.output.closed, False)
+        self.assertEqual(response.getvalue()[:10], '<html><ul>')
+
+    def test_incremental_parsing(self):
+        """HTML payloads are parsed while they are received, if
+        enabled.
+        """
+        options = Options()
+        server = WSGIServer(app.test_app_environ, options)
+        response = server('GET', '/index.html', [])
+        self.assertEqual(response.document, None)
+
+        options.incremental_parsing = True
+        response = server('GET', '/index.html', [])
+        self.assertNotEqual(response.document, None)
+        self.assertEqual(response.document.tag, 'html')
+        self.assertIn(
+            'PATH_INFO: /index.html',
+            response.document.xpath('//li/text()'))
+        self.assertIn('parse', response.timings)
+        self.assertIn('PATH_INFO: /index.html', response.getvalue())
+
+        # Without a charset, only ASCII payloads are parsed.
+        def application(environ, start_response):
+            start_response('200 Ok', [('Content-type', 'text/html')])
+            return ['<html><p>Caf', '\xc3\xa9</p></html>']
+
+        server = WSGIServer(application, options)
+        response = server('GET', '/index.html', [])
+        self.assertEqual(response.document, None)
+
+        # Other payloads are not parsed.
+        server = WSGIServer(app.test_app_text, options)
+        response = server('GET', '/index.txt', [])
+        self.assertEqual(response.document, None)
+        self.assertEqual(response.getvalue(), 'Hello world!')
@@ -68,6 +68,31 @@ def resolve_location(url):
         parsed[0] = ''
     return urlparse.urlunparse(parsed)
 
+def canonical_url(url, options):
+    """Return a resolved URL as it must be requested to the
+    application, without server nor fragment, or None if it is not
+    served by the configured server.
+    """
+    parsed = urlparse.urlparse(url)
+    if parsed.scheme not in ('', 'http', 'https'):
+        return None
+    if parsed.netloc:
+        scheme = parsed.scheme
+        if not scheme:
+            # Relative to the scheme of the configured server.
+            scheme = 'https' if options.port == '443' else 'http'
+        try:
+            port = parsed.port
+        except ValueError:
+            return None
+        if port is None:
+            port = 443 if scheme == 'https' else 80
+        if ((parsed.hostname or '') != options.server.lower() or
+            str(port) != options.port):
+            return None
+    return urlparse.urlunparse(
+        ('', '', parsed.path or '/', parsed.params, parsed.query, ''))
+
 def format_auth(user, password):
     return 'Basic ' + ':'.join((user, password)).encode('base64').strip()
 
@@ -98,6 +123,29 @@ def encode_multipart_form_data(fields, charset):
     data.append('')
     return 'multipart/form-data; boundary=%s' % BOUNDARY, '\r\n'.join(data)
 
+def encode_form(method, query, form, form_charset, form_enctype,
+                data=None, data_type=None):
+    """Encode a form submitted with ``method``, either in the query
+    or as data. Return the query, the data and its content type.
+    """
+    assert not data, u'cannot have both form and data'
+    assert not data_type, u'cannot specify data_type when using form'
+    if method == 'GET':
+        assert form_enctype == 'application/x-www-form-urlencoded', \
+            u'Invalid form encoding for GET method'
+        if query is not None:
+            raise AssertionError(
+                u'Cannot handle a query with a GET form')
+        return form, None, None
+    assert method == 'POST', u'Only support POST or GET forms'
+    if form_enctype == 'application/x-www-form-urlencoded':
+        return query, urllib.urlencode(form), form_enctype
+    elif form_enctype == 'multipart/form-data':
+        data_type, data = encode_multipart_form_data(form, form_charset)
+        return query, data, data_type
+    raise AssertionError(
+        u"Unsupported form encoding %s" % form_enctype)
+
 
 class File(object):
 
@@ -218,37 +266,103 @@ class ResultSet(object):
         return repr(map(operator.itemgetter(1), self._values))
 
 
+class Timings(dict):
+    """Time spent in different phases, in seconds.
+    """
+
+    def add(self, phase, duration):
+        self[phase] = self.get(phase, 0.0) + duration
+
+    def merge(self, other):
+        for phase, duration in other.items():
+            self.add(phase, duration)
+
+
+# Handlers stopping on the first one returning something else than None.
+FIRST_RESULT_HANDLERS = frozenset(['request', 'response', 'redirect'])
+
+
+def chain_handlers(handlers, first_result=False):
+    """Return a function calling each of the handlers in turn. With
+    ``first_result``, it stops on the first one returning something
+    else than None, and returns that value.
+    """
+    if len(handlers) == 1:
+        return handlers[0]
+    handlers = tuple(handlers)
+
+    if first_result:
+        def chain(*args, **kwargs):
+            for handler in handlers:
+                result = handler(*args, **kwargs)
+                if result is not None:
+                    return result
+            return None
+    else:
+        def chain(*args, **kwargs):
+            for handler in handlers:
+                handler(*args, **kwargs)
+
+    return chain
+
+
 class Handlers(object):
-    """Browser handlers.
+    """Browser handlers. Several handlers can be registered under
+    the same name with ``unique``: they are chained when they are
+    added, not each time they are called.
     """
 
     def __init__(self):
         self.__handlers = {}
+        self.__chains = {}
 
     def add(self, name, handler, unique=False):
         if unique:
             if name not in self.__handlers:
                 self.__handlers[name] = []
             self.__handlers[name].append(handler)
+            self.__chains[name] = chain_handlers(
+                self.__handlers[name], name in FIRST_RESULT_HANDLERS)
         else:
             self.__handlers[name] = handler
+            self.__chains[name] = handler
 
-    def __contains__(self, name):
-        return name in self.__handlers
-
-    def get(self, name, default=None):
+    def remove(self, name, handler=None):
+        """Remove the handlers registered under ``name``, or only
+        ``handler`` if it is given.
+        """
         if name not in self.__handlers:
-            return default
-
+            return
         handlers = self.__handlers[name]
-        if isinstance(handlers, list):
-            def wrapper(*args, **kwargs):
-                for handler in handlers:
-                    handler(*args, **kwargs)
+        if handler is not None:
+            if isinstance(handlers, list):
+                handlers = filter(lambda h: h is not handler, handlers)
+                if handlers:
+                    self.__handlers[name] = handlers
+                    self.__chains[name] = chain_handlers(
+                        handlers, name in FIRST_RESULT_HANDLERS)
+                    return
+            elif handlers is not handler:
+                return
+        del self.__handlers[name]
+        del self.__chains[name]
+
+    def __contains__(self, name):
+        return name in self.__handlers
 
-            return wrapper
+    def copy(self):
+        handlers = Handlers()
+        for name, handler in self.__handlers.items():
+            if isinstance(handler, list):
+                for item in handler:
+                    handlers.add(name, item, unique=True)
+            else:
+                handlers.add(name, handler)
         return handlers
 
+    def get(self, name, default=None):
+        return self.__chains.get(name, default)
+
     def __getitem__(self, name):
         handler = self.get(name, _marker)
         if handler is _marker:
@@ -273,6 +387,12 @@ class Macros(object):
     def add(self, name, macro):
         self.__macros[name] = functools.partial(macro, self.__browser)
 
+    def copy(self, browser):
+        macros = Macros(browser)
+        for name, macro in self.__macros.items():
+            macros.add(name, macro.func)
+        return macros
+
     def __getattr__(self, name):
         macro = self.__macros.get(name)
         if macro is not None:
@@ -4,36 +4,307 @@
 
 import urllib2
 import io
+import lxml.etree
+import lxml.html
+import re
+import tempfile
+import threading
+import zlib
+from timeit import default_timer
 from zope.interface import implements
 
-from infrae.testbrowser.headers import HTTPHeaders
+from infrae.testbrowser.cassette import Cassette
+from infrae.testbrowser.headers import HTTPHeaders, format_cgi_header
 from infrae.testbrowser.interfaces import IWSGIServer, IWSGIResponse
+from infrae.testbrowser.profiling import Profiles, should_profile
+from infrae.testbrowser.utils import Timings
+
+CHARSET_CAPTURE = re.compile(r'charset=(?P<charset>[^;]+)')
+NON_ASCII = re.compile(r'[\x80-\xff]')
+
+
+class WSGIOutput(object):
+    """Buffer for the payload of a response. It is kept in memory
+    until it grows bigger than ``threshold`` bytes, and is spilled to a
+    temporary file after.
+    """
+
+    def __init__(self, threshold=None):
+        self.__threshold = threshold
+        self.__file = io.BytesIO()
+        self.spilled = False
+        self.size = 0
+
+    def write(self, data):
+        if (not self.spilled and self.__threshold is not None and
+            self.size + len(data) > self.__threshold):
+            spill = tempfile.TemporaryFile()
+            spill.write(self.__file.getvalue())
+            self.__file = spill
+            self.spilled = True
+        self.__file.seek(0, io.SEEK_END)
+        self.__file.write(data)
+        self.size += len(data)
+
+    def read(self, size=-1):
+        return self.__file.read(size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self.__file.seek(offset, whence)
+
+    def tell(self):
+        return self.__file.tell()
+
+    def getvalue(self):
+        if self.spilled:
+            self.__file.seek(0)
+            return self.__file.read()
+        return self.__file.getvalue()
+
+    @property
+    def closed(self):
+        return self.__file.closed
+
+    def close(self):
+        self.__file.close()
+
+
+class ContentDecoder(object):
+    """Incrementally decode a payload compressed with ``gzip`` or
+    ``deflate``.
+    """
+
+    def __init__(self, encoding):
+        self.__encoding = encoding
+        self.__started = False
+        if encoding == 'gzip':
+            self.__decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self.__decoder = zlib.decompressobj(zlib.MAX_WBITS)
+
+    def decompress(self, data):
+        try:
+            try:
+                decoded = self.__decoder.decompress(data)
+            except zlib.error:
+                if self.__started or self.__encoding != 'deflate':
+                    raise
+                # Some servers send deflate data without zlib header.
+                self.__decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+                decoded = self.__decoder.decompress(data)
+        except zlib.error as error:
+            raise AssertionError(
+                u'Invalid %s payload: %s' % (self.__encoding, error))
+        self.__started = True
+        return decoded
+
+    def flush(self):
+        return self.__decoder.flush()
+
+
+class WSGIStream(object):
+    """File-like access to the payload of a response, consuming the
+    application iterable on demand.
+    """
+
+    def __init__(self, max_size=None):
+        self.__result = None
+        self.__iterator = None
+        self.__buffer = []
+        self.__buffered = 0
+        self.__max_size = max_size
+        self.decoder = None
+        self.wire_size = 0
+        self.size = 0
+        self.closed = False
+
+    def __append(self, data):
+        if data:
+            self.size += len(data)
+            if self.__max_size is not None and self.size > self.__max_size:
+                self.close()
+                raise AssertionError(
+                    u'Response is bigger than %d bytes' % self.__max_size)
+            self.__buffer.append(data)
+            self.__buffered += len(data)
+
+    def write(self, data):
+        # Used as write callable returned by start_response.
+        self.wire_size += len(data)
+        if self.decoder is not None:
+            data = self.decoder.decompress(data)
+        self.__append(data)
+
+    def start(self, result):
+        self.__result = result
+        self.__iterator = iter(result)
+
+    def fetch(self):
+        """Fetch the next chunk produced by the application into the
+        buffer. Return False when the application is done.
+        """
+        if self.closed:
+            return False
+        try:
+            data = next(self.__iterator)
+        except StopIteration:
+            if self.decoder is not None:
+                self.__append(self.decoder.flush())
+            self.close()
+            return False
+        except:
+            self.close()
+            raise
+        self.write(data)
+        return True
+
+    def read(self, size=-1):
+        if size < 0:
+            while self.fetch():
+                pass
+        else:
+            while self.__buffered < size and self.fetch():
+                pass
+        data = ''.join(self.__buffer)
+        if size < 0 or len(data) <= size:
+            self.__buffer = []
+            self.__buffered = 0
+            return data
+        self.__buffer = [data[size:]]
+        self.__buffered = len(data) - size
+        return data[:size]
+
+    def __iter__(self):
+        while self.__buffer or self.fetch():
+            data = ''.join(self.__buffer)
+            self.__buffer = []
+            self.__buffered = 0
+            if data:
+                yield data
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            if hasattr(self.__result, 'close'):
+                self.__result.close()
 
 
 class WSGIResponse(object):
     implements(IWSGIResponse)
 
-    def __init__(self, app, environ):
+    def __init__(self, app, environ, max_size=None, spill_threshold=None,
+                 decode_content=False, parse_html=False):
         self.__app = app
         self.__environ = environ
+        self.__decode_content = decode_content
+        self.__parse_html = parse_html
+        self.__parser = None
+        self.__ascii_only = False
         self.status = None
         self.headers = HTTPHeaders()
-        self.output = io.BytesIO()
+        self.output = WSGIOutput(spill_threshold)
+        self.stream = None
+        self.document = None
+        self.timings = Timings()
+        self.__body = WSGIStream(max_size)
 
     def start_response(self, status, response_headers, exc_info=None):
         self.status = status
         self.headers.update(response_headers)
-        return self.output.write
+        if self.__decode_content:
+            encoding = self.headers.get('Content-Encoding', '').lower()
+            if encoding in ('gzip', 'x-gzip', 'deflate'):
+                self.__body.decoder = ContentDecoder(
+                    'deflate' if encoding == 'deflate' else 'gzip')
+        return self.__body.write
 
-    def __call__(self):
-        result = self.__app(self.__environ, self.start_response)
-        try:
-            for item in result:
-                self.output.write(item)
-        finally:
-            if hasattr(result, 'close'):
-                result.close()
+    @property
+    def wire_size(self):
+        return self.__body.wire_size
+
+    @property
+    def size(self):
+        return self.__body.size
+
+    def __get_parser(self):
+        # Generators only call start_response when the first chunk of
+        # data is requested, the parser is created with it.
+        content_type = self.headers.get('Content-Type') or ''
+        if content_type.startswith(('text/html', 'text/xhtml')):
+            charset = CHARSET_CAPTURE.search(content_type)
+            if charset is None:
+                self.__ascii_only = True
+            return lxml.html.HTMLParser(
+                encoding=charset.group('charset') if charset else None)
+        return None
+
+    def __feed(self, data):
+        start = default_timer()
+        if self.__parser is None:
+            self.__parser = self.__get_parser() or False
+        if self.__parser:
+            if self.__ascii_only and NON_ASCII.search(data):
+                # Without a charset, lxml guesses the encoding of a
+                # payload fed in chunks differently than the one of a
+                # whole payload: leave it to be parsed at once.
+                self.__parser = False
+            else:
+                self.__parser.feed(data)
+        return default_timer() - start
+
+    def __close_parser(self):
+        start = default_timer()
+        if self.__parser:
+            try:
+                self.document = self.__parser.close()
+            except lxml.etree.XMLSyntaxError:
+                self.document = None
+        return default_timer() - start
+
+    def __call__(self, stream=False):
+        start = default_timer()
+        self.__body.start(self.__app(self.__environ, self.start_response))
+        end = default_timer()
+        self.timings.add('application', end - start)
+        parsing = 0.0
+        if stream:
+            # Generators only call start_response when the first
+            # chunk of data is requested.
+            while self.status is None and self.__body.fetch():
+                pass
+            self.stream = self.__body
+        elif self.__parse_html:
+            # Parse the payload while the application produces it.
+            for data in self.__body:
+                self.output.write(data)
+                parsing += self.__feed(data)
+            parsing += self.__close_parser()
+            self.output.seek(0)
+            self.timings.add('parse', parsing)
+        else:
+            for data in self.__body:
+                self.output.write(data)
+            self.output.seek(0)
+        self.timings.add('body', default_timer() - end - parsing)
+
+    def getfile(self):
+        """Return the payload as a file rewound at its beginning. If
+        it is streamed, this will consume what is left of it.
+        """
+        if self.stream is not None:
+            for data in self.stream:
+                self.output.write(data)
         self.output.seek(0)
+        return self.output
+
+    def getvalue(self):
+        """Return the payload. If it is streamed, this will consume
+        what is left of it.
+        """
+        return self.getfile().getvalue()
+
+    def close(self):
+        self.__body.close()
 
 
 class WSGIServer(object):
@@ -42,30 +313,83 @@ class WSGIServer(object):
     def __init__(self, app, options):
         self.__app = app
         self.options = options
+        self.profiles = Profiles()
+        self.__template = None
+        self.__template_key = None
+        self.__cassette = None
+        self.__cassette_lock = threading.Lock()
+
+    def get_environ_template(self):
+        """Return the part of the environment that only depends on
+        the options. It is computed again only if they changed.
+        """
+        options = self.options
+        key = (options.protocol, options.server, options.port,
+               options.handle_errors, options.multithread,
+               options.multiprocess, options.default_wsgi_environ)
+        if key != self.__template_key:
+            scheme = 'https' if options.port == '443' else 'http'
+            environ = options.default_wsgi_environ.copy()
+            environ['SERVER_PROTOCOL'] = options.protocol
+            environ['SERVER_NAME'] = options.server
+            environ['SERVER_PORT'] = options.port
+            environ['SCRIPT_NAME'] = ''
+            environ['wsgi.version'] = (1, 0)
+            environ['wsgi.url_scheme'] = scheme
+            environ['wsgi.multithread'] = options.multithread
+            environ['wsgi.multiprocess'] = options.multiprocess
+            environ['wsgi.run_once'] = False
+            environ['wsgi.handleErrors'] = options.handle_errors
+            if scheme == 'https':
+                environ['HTTPS'] = 'on'
+            # Keep a copy of the default environ, in case it is
+            # modified in place later on.
+            self.__template_key = key[:-1] + (
+                options.default_wsgi_environ.copy(),)
+            self.__template = environ
+        return self.__template
+
+    def get_cassette(self):
+        """Return the cassette used to record or replay the
+        interactions with the application, or None.
+        """
+        options = self.options
+        if options.cassette is None:
+            return None
+        with self.__cassette_lock:
+            if (self.__cassette is None or
+                (self.__cassette.path, self.__cassette.mode,
+                 self.__cassette.match) !=
+                (options.cassette, options.cassette_mode,
+                 tuple(options.cassette_match))):
+                if self.__cassette is not None:
+                    self.__cassette.save()
+                self.__cassette = Cassette(
+                    options.cassette,
+                    options.cassette_mode,
+                    options.cassette_match)
+            return self.__cassette
+
+    def close(self):
+        """Save the interactions recorded in the cassette.
+        """
+        if self.__cassette is not None:
+            self.__cassette.save()
 
     def get_default_environ(self):
-        scheme = 'https' if self.options.port == '443' else 'http'
-        environ = self.options.default_wsgi_environ.copy()
-        environ['SERVER_PROTOCOL'] = self.options.protocol
-        environ['SERVER_NAME'] = self.options.server
-        environ['SERVER_PORT'] = self.options.port
-        environ['wsgi.version'] = (1, 0)
-        environ['wsgi.url_scheme'] = scheme
+        environ = self.get_environ_template().copy()
         environ['wsgi.input'] = io.BytesIO()
         environ['wsgi.errors'] = io.BytesIO()
-        environ['wsgi.multithread'] = False
-        environ['wsgi.multiprocess'] = False
-        environ['wsgi.run_once'] = False
-        environ['wsgi.handleErrors'] = self.options.handle_errors
-        if scheme == 'https':
-            environ['HTTPS'] = 'on'
         return environ
 
-    def get_environ(self, method, uri, headers, data=None, data_type=None):
+    def get_environ(self, method, uri, headers, data=None, data_type=None,
+                    multithread=False):
         query = ''
-        environ = self.get_default_environ()
+        environ = self.get_environ_template().copy()
+        if multithread:
+            # Requests are made concurrently by this server.
+            environ['wsgi.multithread'] = True
         environ['REQUEST_METHOD'] = method
-        environ['SCRIPT_NAME'] = ''
         if '?' in uri:
             uri, query = uri.split('?', 1)
         if '#' in uri:
@@ -73,17 +397,40 @@ class WSGIServer(object):
         environ['PATH_INFO'] = urllib2.unquote(uri)
         environ['QUERY_STRING'] = query
         if data is not None and data_type is not None:
-            environ['wsgi.input'].write(data)
-            environ['wsgi.input'].seek(0)
+            environ['wsgi.input'] = io.BytesIO(data)
             environ['CONTENT_LENGTH'] = len(data)
             environ['CONTENT_TYPE'] = data_type
+        else:
+            environ['wsgi.input'] = io.BytesIO()
+        environ['wsgi.errors'] = io.BytesIO()
         for name, value in headers:
-            http_name = ('HTTP_' + name.upper()).replace('-', '_')
-            environ[http_name] = value
+            environ[format_cgi_header(name)] = value
         return environ
 
-    def __call__(self, method, uri, headers, data=None, data_type=None):
-        environ = self.get_environ(method, uri, headers, data, data_type)
-        response = WSGIResponse(self.__app, environ)
-        response()
+    def __call__(self, method, uri, headers, data=None, data_type=None,
+                 stream=False, multithread=False):
+        start = default_timer()
+        environ = self.get_environ(
+            method, uri, headers, data, data_type, multithread)
+        duration = default_timer() - start
+        app = self.__app
+        cassette = self.get_cassette()
+        if cassette is not None:
+            replay = cassette.play(method, uri, headers, data)
+            if replay is not None:
+                app = replay
+            else:
+                app = cassette.record(method, uri, headers, data, app)
+        response = WSGIResponse(
+            app, environ,
+            self.options.max_response_size,
+            self.options.spill_threshold,
+            self.options.accept_encoding,
+            self.options.incremental_parsing)
+        response.timings.add('environ', duration)
+        path = environ['PATH_INFO']
+        if should_profile(self.options.profile, path):
+            self.profiles.profile(path, response, stream)
+        else:
+            response(stream)
         return response